@@ -1,6 +1,11 @@
 import panel as pn
+from startup import configure
+
+configure()
+
 from datafed_app import DataFedApp
 
+pn.extension('jsoneditor')
 app = DataFedApp()
 
 @pn.depends(app.param.current_user)
@@ -18,6 +23,8 @@ def update_button_visibility(metadata_json_editor_value):
 # Define the header
 header = pn.Row(
     pn.layout.HSpacer(),
+    app.api_status_pane,
+    pn.layout.Spacer(width=20),
     pn.pane.Markdown("**User:**"),
     pn.bind(lambda current_user: pn.pane.Markdown(f"**{current_user}**"), app.param.current_user),
     pn.layout.Spacer(width=20),
@@ -38,18 +45,42 @@ login_pane = pn.Column(
 record_pane = pn.Column(
     pn.Param(app.param.selected_context, widgets={'selected_context': pn.widgets.Select}),
     pn.Param(app.param.selected_collection, widgets={'selected_collection': pn.widgets.Select}),
-    pn.Tabs(
+    pn.Row(app.collection_tree, pn.Tabs(
         ("Create Record", pn.Column(
-            pn.Row(pn.Param(app.param.title), app.file_selector, app.metadata_json_editor),  # Updated here
+            pn.Row(pn.Column(pn.Param(app.param.title), pn.Param(app.param.schema_id)), app.file_selector, app.metadata_json_editor, app.preview_pane),  # Updated here
+            app.payload_report_pane,
+            app.schema_status_pane,
             app.create_button, 
-            app.record_output_pane
+            app.record_output_pane,
+            pn.Row(app.sync_button, app.sync_status_pane)
+        )),
+        ("Read Record", pn.Column(pn.Param(app.param.record_id), pn.Column(app.read_button,app.update_button,app.delete_button,), app.record_output_pane,app.schema_status_pane,app.metadata_json_editor)),
+        ("Compare", pn.Column(
+            pn.Param(app.param.compare_ids, widgets={'compare_ids': pn.widgets.MultiChoice}),
+            app.compare_button,
+            app.compare_status_pane,
+            app.compare_table
+        )),
+        ("Search", pn.Column(
+            pn.Param(app.param, parameters=['search_text', 'search_tags', 'search_metadata', 'search_in_collection', 'search_page_size', 'search_local', 'search_sort', 'mirror_context'], show_name=False),
+            app.search_button,
+            app.mirror_status_pane,
+            app.search_status_pane,
+            app.search_table
+        )),
+        ("Transfer Data", pn.Column(pn.Param(app.param.source_id), pn.Param(app.param.dest_collection), pn.Param(app.param.dest_context), app.transfer_button, app.record_output_pane)),
+        ("Provenance", app.provenance_graph),
+        ("Export", pn.Column(
+            pn.Param(app.param.export_format),
+            app.export_button,
+            app.export_status_pane,
+            app.export_download
         )),
-        ("Read Record", pn.Column(pn.Param(app.param.record_id), pn.Column(app.read_button,app.update_button,app.delete_button,), app.record_output_pane,app.metadata_json_editor)),
-        
-        )
+        ("Jobs", pn.Column(app.jobs_pane, app.api_metrics_pane)),
+        ("Profiling", pn.bind(app.profiling_panel, app.param.current_user)),
+        ))
 )
 
-# conflict commit ("Transfer Data", pn.Column(pn.Param(app.param.source_id), pn.Param(app.param.dest_collection), app.transfer_button, app.record_output_pane)),
 # Dynamically show the login pane or the record management pane based on login status
 @pn.depends(app.param.current_user)
 def main_content(current_user):
@@ -0,0 +1,55 @@
+"""Measure the cold import time of the app's entry modules.
+
+Usage::
+
+    python benchmarks/bench_import_time.py [module ...] [--top N]
+
+Each module is imported in a fresh interpreter with ``python -X importtime``; the total
+and the slowest imports (cumulative, including their own imports) are printed. Defaults
+to ``datafed_app``, ``datafed_service`` and ``cli``.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ['datafed_app', 'datafed_service', 'cli']
+
+
+def import_times(module):
+    """Return ``[(name, self_us, cumulative_us, depth), ...]``, each module after its imports."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' '))) // 2
+        times.append((name.strip(), int(own), int(cumulative), depth))
+    return times
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=DEFAULT_MODULES)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+    for module in args.modules:
+        times = import_times(module)
+        end = max(i for i, t in enumerate(times) if t[0] == module and t[3] == 0)
+        start = end
+        while start > 0 and times[start - 1][3] > 0:
+            start -= 1
+        print(f"{module}: {times[end][2] / 1000:.0f} ms")
+        # Modules imported directly by ``module``; their time includes their own imports
+        direct = [t for t in times[start:end] if t[3] == 1]
+        for name, _, cumulative, _ in sorted(direct, key=lambda t: -t[2])[:args.top]:
+            print(f"    {name:<40} {cumulative / 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,73 @@
+"""Compare encode time and payload size of metadata encodings.
+
+Usage::
+
+    python benchmarks/bench_metadata_encoding.py [file.ibw ...]
+
+For each IBW file the parsed note is encoded together with the wave data, the way an
+array valued metadata entry would be. Without arguments a synthetic note and a
+256x256x4 array are used.
+"""
+import json
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metadata_encoding  # noqa: E402
+from metadata_encoding import encode_metadata  # noqa: E402
+
+
+class LegacyEncoder(json.JSONEncoder):
+    """``util.MyEncoder`` as it was before bytes were decoded."""
+
+    def default(self, obj):
+        if isinstance(obj, np.integer):
+            return int(obj)
+        elif isinstance(obj, np.floating):
+            return float(obj)
+        elif isinstance(obj, np.ndarray):
+            return obj.tolist()
+        elif isinstance(obj, bytes):
+            return str(obj)
+        return super().default(obj)
+
+
+def load_samples(paths):
+    if not paths:
+        from bench_note_parser import synthetic_note
+        import util
+        note = util.parse_note(synthetic_note())
+        return [dict(note, wData=np.random.rand(256, 256, 4).astype(np.float32), bname=b'sample0001')]
+    from igor2 import binarywave as bw
+    import util
+    samples = []
+    for path in paths:
+        wave = bw.load(path)['wave']
+        metadata = util._read_parms(wave)
+        metadata['wData'] = wave['wData']
+        samples.append(metadata)
+    return samples
+
+
+def measure(label, fn, samples, repeat=5):
+    payloads = [fn(sample) for sample in samples]
+    seconds = min(timeit.repeat(lambda: [fn(sample) for sample in samples], number=1, repeat=repeat))
+    size = sum(len(p.encode('utf-8')) for p in payloads)
+    print(f"{label:<28} {seconds * 1000:9.2f} ms {size / 1024:12.1f} KB")
+
+
+def main(argv):
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    samples = load_samples(argv)
+    print(f"{'encoding':<28} {'time':>12} {'size':>15}")
+    measure('json.dumps + MyEncoder', lambda s: json.dumps(s, cls=LegacyEncoder), samples)
+    backend = 'orjson' if metadata_encoding.orjson is not None else 'json compact'
+    measure(backend, encode_metadata, samples)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
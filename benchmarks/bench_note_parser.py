@@ -0,0 +1,80 @@
+"""Compare util.parse_note against the previous line-by-line note parser.
+
+Usage::
+
+    python benchmarks/bench_note_parser.py [file.ibw ...]
+
+Without arguments a synthetic Asylum style note with several thousand parameters is used.
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import util  # noqa: E402
+
+
+def legacy_parse(parm_string):
+    """The parser ``util._read_parms`` used before ``parse_note``."""
+    parm_string = parm_string.rstrip('\r')
+    parm_string = parm_string.replace(".", "_")
+    parm_list = parm_string.split('\r')
+    parm_dict = dict()
+    for pair_string in parm_list:
+        temp = pair_string.split(':')
+        if len(temp) == 2:
+            temp = [item.strip() for item in temp]
+            try:
+                num = float(temp[1])
+                parm_dict[temp[0]] = num
+                try:
+                    if num == int(num):
+                        parm_dict[temp[0]] = int(num)
+                except OverflowError:
+                    pass
+            except ValueError:
+                parm_dict[temp[0]] = temp[1]
+    return parm_dict
+
+
+def synthetic_note(n_params=5000, seed=0):
+    rng = random.Random(seed)
+    lines = ["Version: 16.10.211", "Date: 2024-03-01", "Time: 12:30:01 PM"]
+    for i in range(n_params):
+        kind = i % 4
+        if kind == 0:
+            value = str(rng.randint(0, 10000))
+        elif kind == 1:
+            value = repr(rng.uniform(-1, 1) * 10 ** rng.randint(-9, 3))
+        elif kind == 2:
+            value = f"Channel{i}Trace"
+        else:
+            value = f"{rng.random():.6f}"
+        lines.append(f"Param{i}: {value}")
+    return "\r".join(lines)
+
+
+def notes_from_files(paths):
+    from igor2 import binarywave as bw
+    notes = []
+    for path in paths:
+        note = bw.load(path)['wave']['note']
+        notes.append(note.decode('utf-8', errors='replace') if isinstance(note, bytes) else note)
+    return notes
+
+
+def main(argv):
+    notes = notes_from_files(argv) if argv else [synthetic_note()]
+    repeat = 20
+    legacy = min(timeit.repeat(lambda: [legacy_parse(n) for n in notes], number=1, repeat=repeat))
+    current = min(timeit.repeat(lambda: [util.parse_note(n) for n in notes], number=1, repeat=repeat))
+    n_params = sum(len(util.parse_note(n)) for n in notes)
+    print(f"notes: {len(notes)}, parameters: {n_params}")
+    print(f"legacy parser: {legacy * 1000:8.2f} ms")
+    print(f"parse_note:    {current * 1000:8.2f} ms ({legacy / current:.2f}x)")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
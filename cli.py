@@ -0,0 +1,147 @@
+"""Command line for scripted bulk operations, without the Panel app.
+
+    python cli.py create --collection c/123 data/*.ibw
+    python cli.py update updates.jsonl
+    python cli.py sync --collection c/123 data/
+    python cli.py export c/123 metadata.csv
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from startup import configure
+
+EXTRACT_CHUNK = 64
+
+
+def _iter_files(paths):
+    from extractors import find_extractor
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    full = os.path.join(root, name)
+                    if find_extractor(full) is not None:
+                        yield full
+        else:
+            yield path
+
+
+def _file_records(paths, workers):
+    """Yield a record per file, extracting metadata ``EXTRACT_CHUNK`` files at a time in parallel."""
+    from extractors import extract_metadata
+    paths = iter(paths)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            chunk = [path for _, path in zip(range(EXTRACT_CHUNK), paths)]
+            if not chunk:
+                return
+            for path, metadata in zip(chunk, executor.map(extract_metadata, chunk)):
+                yield {'title': os.path.basename(path), 'metadata': metadata}
+
+
+def _read_manifest(path):
+    """Records from a JSON array or a JSON lines file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if text.lstrip().startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def _report(result, label):
+    print(f"{label} {len(result.ids)} record(s) in {result.batches} request(s)", file=sys.stderr)
+    for error in result.errors:
+        print(f"error: {error}", file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def cmd_create(service, args):
+    records = _file_records(_iter_files(args.paths), args.workers)
+    result = service.batch_create(records, coll_id=args.collection, context=args.context, schema=args.schema)
+    for record_id in result.ids:
+        print(record_id)
+    return _report(result, "Created")
+
+
+def cmd_update(service, args):
+    result = service.batch_update(_read_manifest(args.manifest), context=args.context)
+    for record_id in result.ids:
+        print(record_id)
+    return _report(result, "Updated")
+
+
+def cmd_sync(service, args):
+    result = service.sync_directory(
+        args.directory, args.collection, context=args.context, pattern=args.pattern, schema=args.schema
+    )
+    print(
+        f"Scanned {result.scanned} file(s): {result.unchanged} unchanged, {result.created} created, "
+        f"{result.updated} updated, {result.deduplicated} matched by content, {result.missing} missing",
+        file=sys.stderr
+    )
+    for error in result.errors:
+        print(f"error: {error}", file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def cmd_export(service, args):
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.').lower() or 'csv'
+    count = service.export(args.collection, args.output, fmt=fmt, context=args.context)
+    print(f"Exported {count} record(s) to {args.output}", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Bulk DataFed operations")
+    parser.add_argument('--context', help="Project or user ID (default: the current DataFed context)")
+    parser.add_argument('--username', help="Log in as this user; the password is read from DATAFED_PASSWORD")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help="Create one record per file with dataBatchCreate")
+    create.add_argument('paths', nargs='+', help="Files, or directories searched for supported files")
+    create.add_argument('--collection', default='root', help="Parent collection ID or alias")
+    create.add_argument('--schema', help="Metadata schema ID for the new records")
+    create.add_argument('--workers', type=int, default=4, help="Parallel metadata extractions")
+    create.set_defaults(func=cmd_create)
+
+    update = commands.add_parser('update', help="Update records with dataBatchUpdate")
+    update.add_argument('manifest', help='JSON array or JSON lines of {"id": ..., "metadata": {...}, ...}')
+    update.set_defaults(func=cmd_update)
+
+    sync = commands.add_parser('sync', help="Create or update records for the new and changed files of a directory")
+    sync.add_argument('directory', help="Directory searched for supported files")
+    sync.add_argument('--collection', default='root', help="Collection ID the directory is synced to")
+    sync.add_argument('--pattern', default='*', help="Only sync file names matching this glob pattern")
+    sync.add_argument('--schema', help="Metadata schema ID for new records")
+    sync.set_defaults(func=cmd_sync)
+
+    export = commands.add_parser('export', help="Export a collection's metadata to CSV or Parquet")
+    export.add_argument('collection', help="Collection ID or alias")
+    export.add_argument('output', help="Output file")
+    export.add_argument('--format', choices=['csv', 'parquet'], help="Default: from the output file extension")
+    export.set_defaults(func=cmd_export)
+    return parser
+
+
+def main(argv=None):
+    configure()
+    args = build_parser().parse_args(argv)
+    from datafed_service import DataFedService
+    service = DataFedService()
+    if args.username:
+        service.login(args.username, os.getenv("DATAFED_PASSWORD", ""))
+    if not service.user():
+        print("Not logged in to DataFed", file=sys.stderr)
+        return 1
+    try:
+        return args.func(service, args)
+    except Exception as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
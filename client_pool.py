@@ -0,0 +1,192 @@
+from __future__ import annotations
+import copy
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from resilience import ResilientAPI, client_lock
+
+# Extra connections one session may use to run independent DataFed calls side by side
+POOL_SIZE = int(os.getenv("DATAFED_POOL_SIZE", "8"))
+POOL_THREADS = int(os.getenv("DATAFED_POOL_THREADS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=POOL_THREADS, thread_name_prefix='datafed-pool')
+_keys = weakref.WeakKeyDictionary()
+_pools = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _raw(api):
+    return api.raw if isinstance(api, ResilientAPI) else api
+
+
+def _message_api(raw, keys):
+    """A new connection to the server of ``raw`` that identifies itself with ``keys``."""
+    from datafed import MessageLib
+    opts = raw.cfg.getOpts()
+    mapi = MessageLib.API(
+        server_host=opts.get('server_host'), server_port=opts.get('server_port'),
+        server_pub_key_file=opts.get('server_pub_key_file'),
+        client_pub_key=keys[0], client_priv_key=keys[1],
+    )
+    mapi.setNackExceptionEnabled(True)
+    return mapi
+
+
+def _keys_of(raw):
+    """The CURVE key pair ``raw`` connects with, or None when it cannot be known."""
+    with _lock:
+        keys = _keys.get(raw)
+    if keys is not None:
+        return keys
+    mapi = getattr(raw, '_mapi', None)
+    if mapi is None or not (mapi.keysLoaded() and mapi.keysValid()):
+        return None
+    opts = raw.cfg.getOpts()
+    try:
+        with open(opts['client_pub_key_file']) as pub, open(opts['client_priv_key_file']) as priv:
+            return pub.read(), priv.read()
+    except (KeyError, OSError):
+        return None
+
+
+def rekey(api):
+    """Reconnect ``api`` with a key pair kept in memory, before logging in.
+
+    DataFed ties a password login to the client's key pair, so clients made later with
+    the same keys are logged in as the same user. Clients with installed keys are left alone.
+    """
+    raw = _raw(api)
+    mapi = getattr(raw, '_mapi', None)
+    if mapi is None or (mapi.keysLoaded() and mapi.keysValid()):
+        return
+    import zmq
+    pub, priv = zmq.curve_keypair()
+    keys = pub.decode('utf-8'), priv.decode('utf-8')
+    new_mapi = _message_api(raw, keys)
+    with client_lock(raw):
+        raw._mapi = new_mapi
+    with _lock:
+        _keys[raw] = keys
+    close(api)
+
+
+def _clone(raw, keys):
+    """A copy of ``raw`` on its own connection, checked to be logged in as the same user."""
+    clone = copy.copy(raw)
+    clone._mapi = _message_api(raw, keys)
+    auth, uid = clone._mapi.getAuthStatus()
+    if not auth or uid != raw._uid:
+        raise RuntimeError("The DataFed login does not carry over to a new connection")
+    return clone
+
+
+class ClientPool:
+    """Up to ``size`` clients logged in like one session's client, created on demand."""
+
+    def __init__(self, raw, keys, size=POOL_SIZE):
+        self.size = size
+        self.uid = raw._uid
+        self.broken = False
+        self._raw = weakref.ref(raw)  # The pool must not keep a closed session's client alive
+        self._keys = keys
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+        try:
+            raw = self._raw()
+            if raw is None:
+                raise RuntimeError("The session's DataFed client has been closed")
+            return ResilientAPI(_clone(raw, self._keys))
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self.broken = True
+                self._cond.notify()
+            raise
+
+    def release(self, client):
+        with self._cond:
+            self._idle.append(client)
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for client in idle:
+            try:
+                client.raw._mapi._conn._socket.close(linger=0)
+            except Exception:
+                pass
+
+
+def pool_for(api):
+    """The client pool of ``api``, or None when its calls have to stay on ``api`` itself."""
+    raw = _raw(api)
+    if getattr(raw, '_uid', None) is None:
+        return None
+    with _lock:
+        pool = _pools.get(raw)
+    if pool is not None and pool.uid == raw._uid:
+        return None if pool.broken else pool
+    keys = _keys_of(raw)
+    if keys is None:
+        return None
+    pool = ClientPool(raw, keys)
+    with _lock:
+        old, _pools[raw] = _pools.get(raw), pool
+    if old is not None:
+        old.close()
+    return pool
+
+
+def close(api):
+    """Drop the extra clients of ``api``, e.g. on logout."""
+    with _lock:
+        pool = _pools.pop(_raw(api), None)
+    if pool is not None:
+        pool.close()
+
+
+def map_clients(api, fn, items, workers=POOL_SIZE):
+    """Return ``[fn(client, item) for item in items]`` with the calls spread over clients logged in like ``api``.
+
+    Each client carries one request at a time. When ``api`` cannot be cloned the calls
+    run one after another on ``api``. The first error raised by ``fn`` is re-raised.
+    """
+    items = list(items)
+    pool = pool_for(api) if len(items) > 1 else None
+    if pool is None:
+        return [fn(api, item) for item in items]
+    results = [None] * len(items)
+    pending = iter(enumerate(items))
+    pending_lock = threading.Lock()
+
+    def work():
+        try:
+            client = pool.acquire()
+        except Exception:
+            client = None
+        try:
+            while True:
+                with pending_lock:
+                    index, item = next(pending, (None, None))
+                if index is None:
+                    return
+                results[index] = fn(client or api, item)
+        finally:
+            if client is not None:
+                pool.release(client)
+
+    futures = [_executor.submit(work) for _ in range(min(workers, pool.size, len(items)))]
+    for future in futures:
+        future.result()
+    return results
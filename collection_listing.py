@@ -0,0 +1,46 @@
+from __future__ import annotations
+import os
+from collections import Counter
+from cache import LRUCache
+
+COLLECTION_CACHE_TTL = float(os.getenv("COLLECTION_CACHE_TTL", "300"))
+COLLECTION_PAGE_SIZE = 500
+
+# Children of each (user, context, collection), so titles are only shown to users allowed to list them
+collection_cache = LRUCache(maxsize=2048, ttl=COLLECTION_CACHE_TTL)
+
+
+def list_child_collections(api, coll_id, context=None):
+    """Return ``[(title, id), ...]`` for the sub-collections of ``coll_id``, using the cache."""
+    key = cache_key(api, context, coll_id)
+    children = collection_cache.get(key)
+    if children is None:
+        children = []
+        offset = 0
+        while True:
+            items_list = api.collectionItemsList(coll_id, offset=offset, count=COLLECTION_PAGE_SIZE, context=context)
+            items = items_list[0].item
+            children += [(item.title, item.id) for item in items if item.id.startswith("c/")]
+            if len(items) < COLLECTION_PAGE_SIZE:
+                break
+            offset += COLLECTION_PAGE_SIZE
+        collection_cache.set(key, children)
+    return children
+
+
+def cache_key(api, context, coll_id):
+    return (api.getAuthUser(), context, coll_id)
+
+
+def labelled(children):
+    """``{label: id}`` for ``[(title, id), ...]``; titles shared by several collections get their ID appended."""
+    counts = Counter(title for title, _ in children)
+    return {title if counts[title] == 1 else f"{title} ({coll_id})": coll_id for title, coll_id in children}
+
+
+def invalidate_collection(context, coll_id=None):
+    """Drop cached children of ``coll_id``, or of every collection in ``context``, for every user."""
+    if coll_id is None:
+        collection_cache.invalidate(lambda key: key[1] == context)
+    else:
+        collection_cache.invalidate(lambda key: key[1:] == (context, coll_id))
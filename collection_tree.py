@@ -0,0 +1,106 @@
+from __future__ import annotations
+from concurrent.futures import ThreadPoolExecutor
+import param
+import panel as pn
+from panel.viewable import Viewer
+from collection_listing import cache_key, collection_cache, invalidate_collection, list_child_collections
+
+# One worker: prefetches share the session's client, whose calls are serialised anyway
+_prefetch_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='collection-prefetch')
+
+
+class CollectionTree(Viewer):
+    """Collection hierarchy whose nodes load their children when first expanded."""
+
+    context = param.String(default=None, allow_None=True, doc="Context whose collections are shown.")
+    value = param.String(default=None, allow_None=True, doc="ID of the selected collection.")
+    value_title = param.String(default="", doc="Title of the selected collection.")
+
+    def __init__(self, api, **params):
+        super().__init__(**params)
+        self._api = api
+        self._expanded = set()
+        self._child_columns = {}
+        self._toggles = {}
+        self._parents = {}
+        self._reload = pn.widgets.Button(name='↻', width=40, height=40)
+        self._reload.on_click(self.reload)
+        self._message = pn.pane.Markdown("", margin=0)
+        self._root = pn.Column(margin=0)
+        self._layout = pn.Column(
+            pn.Row(pn.pane.Markdown("**Collections**"), self._reload),
+            self._message, self._root, width=300, scroll=True, max_height=400
+        )
+        self.param.watch(self._context_changed, 'context')
+
+    def __panel__(self):
+        return self._layout
+
+    def _context_changed(self, event=None):
+        self._expanded.clear()
+        self._child_columns.clear()
+        self._toggles.clear()
+        self._parents.clear()
+        if not self.context:
+            self._root[:] = []
+            return
+        self._root[:] = [self._make_node('root', 'root', None)]
+        self._expand('root')
+
+    def reload(self, event=None):
+        """Invalidate the cached hierarchy of the current context and redraw it."""
+        invalidate_collection(self.context)
+        self._context_changed()
+
+    def _make_node(self, title, coll_id, parent_id):
+        self._parents[coll_id] = parent_id
+        toggle = pn.widgets.Button(name='▶', width=30, height=30, margin=(0, 2), button_type='light')
+        toggle.on_click(lambda event: self._toggle(coll_id))
+        label = pn.widgets.Button(name=title, height=30, margin=(0, 2), button_type='light')
+        label.on_click(lambda event: self._select(title, coll_id))
+        children = pn.Column(margin=(0, 0, 0, 20), visible=False)
+        self._toggles[coll_id] = toggle
+        self._child_columns[coll_id] = children
+        return pn.Column(pn.Row(toggle, label, margin=0), children, margin=0)
+
+    def _select(self, title, coll_id):
+        with param.parameterized.batch_call_watchers(self):
+            self.value_title = title
+            self.value = coll_id
+
+    def _toggle(self, coll_id):
+        if coll_id in self._expanded:
+            self._expanded.discard(coll_id)
+            self._child_columns[coll_id].visible = False
+            self._toggles[coll_id].name = '▶'
+        else:
+            self._expand(coll_id)
+
+    def _expand(self, coll_id):
+        try:
+            children = list_child_collections(self._api, coll_id, self.context)
+        except Exception as e:
+            self._message.object = f"Error: Failed to list collections: {e}"
+            return
+        self._message.object = ""
+        column = self._child_columns[coll_id]
+        if not column.objects:
+            column[:] = [self._make_node(title, child_id, coll_id) for title, child_id in children]
+        column.visible = True
+        self._toggles[coll_id].name = '▼'
+        self._expanded.add(coll_id)
+        self._prefetch(coll_id, children)
+
+    def _prefetch(self, coll_id, children):
+        """Warm the cache with the children of the expanded node's children and siblings."""
+        parent_id = self._parents.get(coll_id)
+        siblings = list_child_collections(self._api, parent_id, self.context) if parent_id else []
+        for _, other_id in children + siblings:
+            if cache_key(self._api, self.context, other_id) not in collection_cache:
+                _prefetch_executor.submit(self._prefetch_one, other_id, self.context)
+
+    def _prefetch_one(self, coll_id, context):
+        try:
+            list_child_collections(self._api, coll_id, context)
+        except Exception:
+            pass
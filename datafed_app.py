@@ -1,19 +1,39 @@
 from __future__ import annotations
+import io
 import json
+import threading
+import time
+import uuid
 import param
 import panel as pn
+import pandas as pd
 from datafed.CommandLib import API
 from file_selector import FileSelector
-from google.protobuf.json_format import MessageToJson
+from job_queue import QUEUED, RUNNING, DONE, FAILED
+from datafed_service import DataFedService, job_queue, SEARCH_COLUMNS
+from scheduler import UpdateScheduler, session_callback
+from cache import LRUCache
+from collection_tree import CollectionTree
+from provenance_graph import ProvenanceGraph
+from preview import generate_previews_async
+from metadata_encoding import encode_metadata, payload_report, format_report
+from schema_validation import validate_metadata
+from resilience import breaker
+from session_store import get_session_store, listing_stamp
+from lazy_json import LazyJSONEditor
+import profiling
+from profiling import profiled
+from record_compare import fetch_records, compare_metadata
+from export import EXPORT_FORMATS, export_path
+from mirror import get_syncer, parse_filter
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 FILE_PATH = os.getenv("FILE_PATH")
-pn.extension('material')
-pn.extension('jsoneditor')
+UPDATE_DEBOUNCE_MS = int(os.getenv("UPDATE_DEBOUNCE_MS", "250"))
+SEARCH_MAX_RESULTS = int(os.getenv("SEARCH_MAX_RESULTS", "1000"))
 
 class DataFedApp(param.Parameterized):
+    _profiler = None
     df_api = param.ClassSelector(class_=API, default=None)
 
     username = param.String(default="", label="Username")
@@ -21,14 +41,18 @@ class DataFedApp(param.Parameterized):
 
     title = param.String(default="", label="Title")
     metadata = param.String(default="", label="Metadata (JSON format)")
+    schema_id = param.String(default="", label="Metadata Schema ID (optional)")
+    metadata_errors = param.List(default=[], label="Metadata Schema Errors")
 
     record_id = param.Selector(default=None, objects={}, label="Select Record")
     update_metadata = param.String(default="", label="Update Metadata (JSON format)")
     metadata_changed = param.Boolean(default=False, label="Metadata Changed")
     show_update_button = param.Boolean(default=False, label="Show Update Button")
+    compare_ids = param.ListSelector(default=[], objects={}, label="Records to Compare")
 
-    source_id = param.String(default="", label="Source ID")
+    source_id = param.String(default="", label="Source ID(s), comma separated")
     dest_collection = param.String(default="", label="Destination Collection")
+    dest_context = param.String(default="", label="Destination Context (blank for current; another context gets a metadata-only copy)")
 
     login_status = param.String(default="", label="Login Status")
     record_output = param.String(default="", label="Record Output")
@@ -43,13 +67,27 @@ class DataFedApp(param.Parameterized):
     selected_collection = param.Selector(objects={}, label="Select Collection")
     available_collections = param.Dict(default={}, label="Available Collections")
 
+    search_text = param.String(default="", label="Title / Description Text")
+    search_tags = param.String(default="", label="Tags (comma separated)")
+    search_metadata = param.String(default="", label="Metadata Expression")
+    search_in_collection = param.Boolean(default=False, label="Only Search Selected Collection")
+    search_page_size = param.Integer(default=50, bounds=(1, 500), label="Page Size")
+    search_local = param.Boolean(default=False, label="Search Local Mirror")
+    search_sort = param.String(default="", label="Sort By (local mirror: title, ut or a metadata key; - for descending)")
+    mirror_context = param.Boolean(default=False, label="Mirror Selected Context Locally")
+
+    export_format = param.Selector(default='csv', objects=EXPORT_FORMATS, label="Export Format")
+
     show_login_panel = param.Boolean(default=False)
 
-    original_metadata = param.Dict(default={}, label="Original Metadata")  # To track the original metadata
+    original_record = param.Dict(default={}, label="Original Record")  # To track the record as it was read
 
     def __init__(self, **params):
         params['df_api'] = API() 
         super().__init__(**params)
+        # DataFed logic lives in the service; all its server calls go through timeouts, retries and the circuit breaker
+        self.service = DataFedService(self.df_api)
+        self.api = self.service.api
         self.login_button = pn.widgets.Button(name='Login', button_type='primary')
         self.login_button.on_click(self.toggle_login_panel)
         
@@ -75,29 +113,120 @@ class DataFedApp(param.Parameterized):
         self.logout_button = pn.widgets.Button(name='Logout', button_type='warning')
         self.logout_button.on_click(self.logout)
 
-        self.projects_json_pane = pn.pane.JSON(object=None, name='Projects Output', depth=3, width=600, height=400)
-        self.metadata_json_editor = pn.widgets.JSONEditor(name='Metadata', width=600)
+        self.search_button = pn.widgets.Button(name='Search', button_type='primary')
+        self.search_button.on_click(self.search_records)
+        self.search_table = pn.widgets.Tabulator(
+            pd.DataFrame(columns=SEARCH_COLUMNS), name='Search Results', disabled=True,
+            show_index=False, pagination='remote', page_size=20, width=600
+        )
+        self.search_table.on_click(self.on_search_result_click)
+        self.search_status_pane = pn.pane.Markdown("", width=600)
+        self._search_generation = 0
+        self.mirror_status_pane = pn.pane.Markdown("", width=600)
+        self._mirror = get_syncer()
+        self._session_id = uuid.uuid4().hex
+
+        self.compare_button = pn.widgets.Button(name='Compare', button_type='primary')
+        self.compare_button.on_click(self.compare_records)
+        self.compare_table = pn.widgets.Tabulator(
+            pd.DataFrame(columns=['key']), name='Differences', disabled=True, show_index=False,
+            pagination='remote', page_size=50, frozen_columns=['key'], width=900
+        )
+        self.compare_status_pane = pn.pane.Markdown("", width=600)
+
+        self.export_button = pn.widgets.Button(name='Export Collection Metadata', button_type='primary')
+        self.export_button.on_click(self.export_metadata)
+        self.export_download = pn.widgets.FileDownload(button_type='success', visible=False)
+        self.export_status_pane = pn.pane.Markdown("", width=600)
+
+        self.sync_button = pn.widgets.Button(name='Sync Directory to Collection', button_type='primary')
+        self.sync_button.on_click(self.sync_directory)
+        self.sync_status_pane = pn.pane.Markdown("", width=600)
+
+        # Large records stay on the server; the browser only receives the collapsed top levels
+        self.projects_json_pane = LazyJSONEditor(name='Projects Output', readonly=True, depth=2, width=600, height=400)
+        self.metadata_json_editor = LazyJSONEditor(name='Metadata', depth=3, width=600)
         self.record_output_pane = pn.pane.Markdown("<h3>Status Empty</h3>", name='Status', width=600)
+        self.jobs_pane = pn.pane.Markdown("", name='Jobs', width=600)
+        self.api_status_pane = pn.pane.Markdown("", name='DataFed Status')
+        self.api_metrics_pane = pn.pane.Markdown("", name='DataFed Metrics', width=600)
+        self.payload_report_pane = pn.pane.Markdown("", name='Payload Size', width=600)
+        self.schema_status_pane = pn.pane.Markdown("", name='Schema Validation', width=600)
+
+        self.collection_tree = CollectionTree(self.api)
+        self.collection_tree.param.watch(self.on_tree_select, 'value')
+        self.provenance_graph = ProvenanceGraph(self.api)
+        self.param.watch(self.on_record_select, 'record_id')
 
         self.file_selector = FileSelector(FILE_PATH)
-        self.file_selector.param.watch(self.update_metadata_from_file_selector, 'value')
+        self.file_selector.param.watch(self.update_metadata_from_file_selector, 'metadata')
+        self.file_selector.param.watch(self.update_preview, 'value')
+        self.preview_pane = pn.Column(name='Preview', width=300)
 
+        self._scheduler = UpdateScheduler(delay=UPDATE_DEBOUNCE_MS / 1000)
         self.param.watch(self.update_collections, 'selected_context')
+        self.param.watch(self.refresh_mirror_status, 'selected_context')
+        self.param.watch(self.toggle_mirror, 'mirror_context')
+        self.param.watch(self.on_collection_change, 'selected_collection')
         self.metadata_json_editor.param.watch(self.on_metadata_change, 'value')
         self.param.watch(self.toggle_update_button_visibility, 'metadata_changed')
+        self.param.watch(self.schedule_validation, 'schema_id')
+
+        self._session = get_session_store()
+        self._user_key = None
+        self._restoring = False
+        self.param.watch(self.save_selection, ['selected_context', 'selected_collection', 'record_id'])
+        self.file_selector._directory.param.watch(self.save_selection, 'value')
+
+        self.profile_user_select = pn.widgets.Select(name='Session user', options=[], width=250)
+        self.profile_refresh_button = pn.widgets.Button(name='Refresh', width=80, align='end')
+        self.profile_refresh_button.on_click(self.refresh_profiling)
+        self.profile_start_button = pn.widgets.Button(name='Start Profiling', button_type='primary', width=120, align='end')
+        self.profile_start_button.on_click(self.start_profiling)
+        self.profile_stop_button = pn.widgets.Button(name='Stop Profiling', button_type='warning', width=120, align='end')
+        self.profile_stop_button.on_click(self.stop_profiling)
+        self.profile_summary_pane = pn.pane.Markdown("", width=800)
+        self.profile_stacks_download = pn.widgets.FileDownload(
+            callback=lambda: self._profile_file(lambda profiler: profiler.collapsed_stacks()),
+            filename='profile.collapsed', label='Download flame data'
+        )
+        self.profile_report_download = pn.widgets.FileDownload(
+            callback=lambda: self._profile_file(lambda profiler: profiling.report_json(profiler.user)),
+            filename='profile.json', label='Download report'
+        )
+        profiling.register(self, self)
+        profiling.register(self.file_selector, self)
+
+        job_queue.start()
+        self.refresh_jobs()
+        self.refresh_api_status()
+        pn.state.add_periodic_callback(self.refresh_jobs, period=2000)
+        pn.state.add_periodic_callback(self.refresh_api_status, period=2000)
+        pn.state.add_periodic_callback(self.refresh_mirror_status, period=5000)
+        if pn.state.curdoc is not None:
+            pn.state.on_session_destroyed(self._on_session_destroyed)
 
         pn.state.onload(self.initial_login_check)
 
+    def _on_session_destroyed(self, session_context):
+        # A closed tab stops syncing the mirror and releases its extra DataFed connections
+        self._mirror.detach(self._session_id)
+        self.service.close()
+
     def initial_login_check(self):
         try:
-            user_info = self.df_api.getAuthUser()
+            user_info = self.api.getAuthUser()
             if user_info:
                 self.current_user = user_info
-                self.current_context = self.df_api.getContext()
-                ids, titles = self.get_available_contexts()
-                self.available_contexts = {title: id_ for id_, title in zip(ids, titles)}
-                self.param['selected_context'].objects = self.available_contexts
-                self.selected_context = ids[0] if ids else None
+                self.current_context = self.api.getContext()
+                self._user_key = str(user_info)
+                profiling.sync()
+                self._mirror.attach(self._session_id, self._user_key, self.api)
+                self.service.resume_jobs()
+                if self.restore_session():
+                    self.record_output_pane.object = "<h3>User in session!</h3>"
+                    return
+                self.set_available_contexts(*self.get_available_contexts())
                 self.record_output_pane.object = "<h3>User in session!</h3>"
             else:
                 self.current_user = "Not Logged In"
@@ -105,133 +234,368 @@ class DataFedApp(param.Parameterized):
         except Exception as e:
             self.record_output_pane.object = f"<h3>Error: {e}</h3>"
 
+    def set_available_contexts(self, ids, titles):
+        self.available_contexts = {title: id_ for id_, title in zip(ids, titles)}
+        if self._user_key:
+            self._session.save_listing(self._user_key, 'contexts', {'items': self.available_contexts})
+        self.param['selected_context'].objects = self.available_contexts
+        self.selected_context = ids[0] if ids else None
+
+    def restore_session(self):
+        """Rehydrate selections and listings from the last saved snapshot, then revalidate in the background.
+
+        Returns False when there is no snapshot to restore from.
+        """
+        state = self._session.load(self._user_key)
+        contexts = self._session.listing(state, 'contexts')
+        if not contexts or state.get('context') not in contexts['data']['items'].values():
+            return False
+        context = state['context']
+        collections = self._session.listing(state, 'collections')
+        if collections and collections['data']['context'] != context:
+            collections = None
+        records = self._session.listing(state, 'records')
+        coll_id = collections['data']['items'].get(state.get('collection')) if collections else None
+        if records and (records['data']['context'], records['data']['coll_id']) != (context, coll_id):
+            records = None
+
+        self._restoring = True
+        try:
+            with param.parameterized.batch_call_watchers(self):
+                self.available_contexts = contexts['data']['items']
+                self.param['selected_context'].objects = self.available_contexts
+                self.selected_context = context
+                if collections:
+                    self.available_collections = collections['data']['items']
+                    self.param['selected_collection'].objects = self.available_collections
+                    self.selected_collection = state.get('collection')
+                if records:
+                    self._set_record_options(records['data']['items'])
+                    self.record_id = state.get('record')
+            if state.get('directory'):
+                self.file_selector.go_to(state['directory'])
+        finally:
+            self._restoring = False
+
+        stamps = {name: listing['stamp'] if listing else None
+                  for name, listing in (('contexts', contexts), ('collections', collections), ('records', records))}
+        self._scheduler.schedule(
+            'revalidate',
+            lambda: self._fetch_listings(context, coll_id),
+            lambda listings: self._apply_revalidated(listings, stamps),
+            on_error=self._on_fetch_error
+        )
+        return True
+
+    def _fetch_listings(self, context, coll_id):
+        ids, titles = self.get_available_contexts()
+        contexts = {title: id_ for id_, title in zip(ids, titles)}
+        collections = self._fetch_collections(context)
+        records = self._fetch_records(coll_id, context) if coll_id else None
+        self._session.save_listing(self._user_key, 'contexts', {'items': contexts})
+        return {'contexts': contexts, 'collections': collections, 'records': records}
+
+    def _apply_revalidated(self, listings, stamps):
+        """Apply only the listings that changed since the restored snapshot, keeping current selections."""
+        with param.parameterized.batch_call_watchers(self):
+            if listing_stamp({'items': listings['contexts']}) != stamps['contexts']:
+                self.available_contexts = listings['contexts']
+                self.param['selected_context'].objects = self.available_contexts
+            collections = listings['collections']
+            if isinstance(collections, dict) and listing_stamp(collections) != stamps['collections']:
+                self.available_collections = collections['items']
+                self.param['selected_collection'].objects = self.available_collections
+                if self.selected_collection not in self.available_collections:
+                    self.selected_collection = next(iter(self.available_collections), None)
+            records = listings['records']
+            if records is not None and listing_stamp(records) != stamps['records']:
+                self._set_record_options(records['items'])
+                if self.record_id not in records['items'].values() and self.record_id not in records['items']:
+                    self.record_id = next(iter(records['items']), None)
+        self.collection_tree.context = self.selected_context
+        self.provenance_graph.context = self.selected_context
+
+    def save_selection(self, event=None):
+        """Remember the current selections so a reload can restore them."""
+        if self._restoring or not self._user_key:
+            return
+        self._session.update(
+            self._user_key,
+            context=self.selected_context,
+            collection=self.selected_collection,
+            record=self.record_id,
+            directory=self.file_selector._directory.value
+        )
+
     def toggle_login_panel(self, event=None):
         self.show_login_panel = not self.show_login_panel  
 
     def check_login(self, event):
         try:
-            self.df_api.loginByPassword(self.username, self.password)
-            user_info = self.df_api.getAuthUser()
+            user_info = self.service.login(self.username, self.password)
             if hasattr(user_info, 'username'):
                 self.current_user = user_info.username
             else:
                 self.current_user = str(user_info)
-            self.current_context = self.df_api.getContext()
-            ids, titles = self.get_available_contexts()
-            self.available_contexts = {title: id_ for id_, title in zip(ids, titles)}
-            self.param['selected_context'].objects = self.available_contexts
-            self.selected_context = ids[0] if ids else None
+            self.current_context = self.api.getContext()
+            self._user_key = str(user_info)
+            profiling.sync()
+            self._mirror.attach(self._session_id, self._user_key, self.api)
+            self.service.resume_jobs()
+            self.set_available_contexts(*self.get_available_contexts())
             self.record_output_pane.object = "<h3>Login Successful!</h3>"
             self.show_login_panel = False
-            self.update_records()
+            self.update_collections()
         except Exception as e:
             self.record_output_pane.object = f"<h3>Invalid username or password: {e}</h3>"
 
     def logout(self, event):
-        self.df_api.logout()
+        self.service.logout()
+        self._mirror.detach(self._session_id)
+        self._user_key = None
+        profiling.sync()
         self.current_user = "Not Logged In"
         self.current_context = "No Context"
         self.record_output_pane.object = "<h3>Logged out successfully!</h3>"
         self.username = ""
         self.password = ""
 
-    def update_collections(self, event):
+    def update_collections(self, event=None):
+        """Schedule a debounced collection listing for the selected context."""
         context_id = self.selected_context
- 
-        if context_id:
-            collections = self.get_collections_in_context(context_id)
+
+        if context_id and not self._restoring:
+            # Records of the previous context are no longer wanted
+            self._scheduler.cancel('records')
+            self._scheduler.schedule(
+                'collections',
+                lambda: self._fetch_collections(context_id),
+                self._apply_collections,
+                on_error=self._on_fetch_error
+            )
+
+    def _fetch_collections(self, context):
+        collections = self.get_collections_in_context(context)
+        if not isinstance(collections, dict):
+            return collections
+        listing = {'context': context, 'items': collections}
+        if self._user_key:
+            self._session.save_listing(self._user_key, 'collections', listing)
+        return listing
+
+    def _apply_collections(self, listing):
+        if not isinstance(listing, dict):
+            self.record_output_pane.object = f"<h3>{listing[0]}</h3>"
+            return
+        collections = listing['items']
+        with param.parameterized.batch_call_watchers(self):
             self.available_collections = collections
             self.param['selected_collection'].objects = collections
             if collections:
                 self.selected_collection = next(iter(collections))
+        # The root listing is cached by now, so the tree renders without another request
+        self.collection_tree.context = self.selected_context
+        self.provenance_graph.context = self.selected_context
+        self.update_records()
+
+    def on_collection_change(self, event):
+        if not self._restoring:
             self.update_records()
 
+    def on_record_select(self, event):
+        """Offer the selected record as the root of the dependency graph."""
+        self.provenance_graph.record_id = event.new or ""
+
+    def on_tree_select(self, event):
+        """Make a (possibly nested) collection picked in the tree the selected collection."""
+        if not event.new:
+            return
+        # Labels map to IDs, so a nested collection sharing a title gets its ID in the label
+        label = next((label for label, coll_id in self.available_collections.items() if coll_id == event.new), None)
+        if label is None:
+            label = self.collection_tree.value_title
+            if label in self.available_collections:
+                label = f"{label} ({event.new})"
+        collections = dict(self.available_collections)
+        collections[label] = event.new
+        with param.parameterized.batch_call_watchers(self):
+            self.available_collections = collections
+            self.param['selected_collection'].objects = collections
+            self.selected_collection = label
+
     def get_collections_in_context(self, context):
         try:
-            self.df_api.setContext(context)
-            items_list = self.df_api.collectionItemsList('root', context=context)
-            collections = {item.title: item.id for item in items_list[0].item if item.id.startswith("c/")}
-            collections['root']='root'
-            return collections
+            return self.service.collections(context)
         except Exception as e:
             return [f"Error: {e}"]
 
+    @profiled()
     def update_metadata_from_file_selector(self, event):
+        self.metadata_json_editor.value = self.file_selector.metadata or {}
+
+    def update_preview(self, event):
+        """Show per-channel thumbnails of the selected IBW file, generated off the server process."""
+        self.preview_pane[:] = []
+        selected = self.file_selector.value
+        if not selected or not selected[0].lower().endswith('.ibw'):
+            return
+        path = selected[0]
+        self.preview_pane[:] = [pn.pane.Markdown("Generating preview...")]
+        future = generate_previews_async(path)
+        # Done callbacks run on the executor's thread; the panes are updated in the session
+        show = session_callback(self._show_preview)
+        future.add_done_callback(lambda f: show(path, f))
+
+    def _show_preview(self, path, future):
+        if self.file_selector.value[:1] != [path]:
+            return  # Selection changed while the preview was generated
         try:
-            json_data = self.file_selector._update_output(self.file_selector.value)
-            if json_data:
-                self.metadata_json_editor.value = json_data
-            else:
-                self.metadata_json_editor.value = {}
-        except json.JSONDecodeError as e:
-            self.metadata_json_editor.value = {"error": f"Invalid JSON file: {e}"}
+            previews = future.result()
         except Exception as e:
-            self.metadata_json_editor.value = {"error": f"Error processing file: {e}"}
+            self.preview_pane[:] = [pn.pane.Markdown(f"Preview unavailable: {e}")]
+            return
+        self.preview_pane[:] = [
+            pn.Column(pn.pane.PNG(preview['png'], width=128), pn.pane.Markdown(f"{preview['label']} ({preview['unit']})"))
+            for preview in previews
+        ]
 
     def create_record(self, event):
         if not self.title or not self.metadata_json_editor.value:
             self.record_output_pane.object = "<h3>Error: Title and metadata are required</h3>"
             return
+        if not self._metadata_valid():
+            return
         try:
-            if self.selected_context:
-                self.df_api.setContext(self.selected_context)
-            response = self.df_api.dataCreate(
-                title=self.title,
-                metadata=json.dumps(self.metadata_json_editor.value),
-                parent_id=self.available_collections[self.selected_collection] 
+            result = self.service.create_record(
+                self.title,
+                self.metadata_json_editor.value,
+                parent_id=self.available_collections[self.selected_collection],
+                context=self.selected_context,
+                schema=self.schema_id or None
             )
-            record_id = response[0].data[0].id
-            self.record_output_pane.object = f"<h3>Success: Record created with ID {record_id}</h3>"
+            self.record_output_pane.object = f"<h3>Success: Record created with ID {result.id} ({format_report(result.report)})</h3>"
             self.update_records()
         except Exception as e:
             self.record_output_pane.object = f"<h3>Error: Failed to create record: {e}</h3>"
 
+    @profiled()
     def update_records(self):
-        try:
-            if not self.available_collections[self.selected_collection]:
-                self.record_output_pane.object = "<h3>Warning: Context or Collection not selected</h3>"
-                return
-            
-            items_list = self.df_api.collectionItemsList(coll_id=self.available_collections[self.selected_collection], context=self.selected_context)
-            
-            records = {item.title: item.id for item in items_list[0].item if item.id.startswith("d/")}
-            
-            self.param['record_id'].objects = records
+        """Schedule a debounced record listing; repeated calls coalesce into one fetch."""
+        coll_id = self.available_collections.get(self.selected_collection)
+        if not coll_id:
+            self.record_output_pane.object = "<h3>Warning: Context or Collection not selected</h3>"
+            return
+        context = self.selected_context
+        self._scheduler.schedule(
+            'records',
+            lambda: self._fetch_records(coll_id, context),
+            self._apply_records,
+            on_error=self._on_fetch_error
+        )
+
+    def get_records_in_collection(self, coll_id, context):
+        return self.service.records(coll_id, context)
+
+    @profiled('update_records.fetch')
+    def _fetch_records(self, coll_id, context):
+        listing = {'context': context, 'coll_id': coll_id, 'items': self.get_records_in_collection(coll_id, context)}
+        if self._user_key:
+            self._session.save_listing(self._user_key, 'records', listing)
+        return listing
+
+    @profiled('update_records.apply')
+    def _apply_records(self, listing):
+        records = listing['items']
+        with param.parameterized.batch_call_watchers(self):
+            self._set_record_options(records)
             if records:
                 self.record_id = next(iter(records))
             else:
                 self.record_id = None
-                self.record_output_pane.object = "<h3>No records found in the selected collection</h3>"
-        
-        except Exception as e:
-            self.record_output_pane.object = f"<h3>Error: Failed to fetch records: {e}</h3>"
+        if not records:
+            self.record_output_pane.object = "<h3>No records found in the selected collection</h3>"
+
+    def _set_record_options(self, records):
+        self.param['record_id'].objects = records
+        self.param['compare_ids'].objects = records
+        self.compare_ids = [record_id for record_id in self.compare_ids if record_id in records.values()]
+
+    def _on_fetch_error(self, error):
+        self.record_output_pane.object = f"<h3>Error: Failed to fetch records: {error}</h3>"
 
     def on_metadata_change(self, event):
         """Callback to handle changes in the JSON editor."""
         self.metadata_changed = True
+        value = event.new
+        self._scheduler.schedule('payload', lambda: payload_report(encode_metadata(value)), self._show_payload_report)
+        self.schedule_validation()
+
+    def _show_payload_report(self, report):
+        self.payload_report_pane.object = format_report(report) if report['bytes'] > 2 else ""
+
+    def _editor_metadata(self):
+        """Return ``(schema_id, metadata)`` for the editor: a record read in the Read tab or new metadata."""
+        value = self.metadata_json_editor.value or {}
+        records = value.get('data') if isinstance(value, dict) else None
+        if isinstance(records, list) and records and 'metadata' in records[0]:
+            record = records[0]
+            return record.get('schema') or record.get('schId'), record['metadata']
+        return self.schema_id, value
+
+    def schedule_validation(self, event=None):
+        """Validate the editor metadata locally against its schema as the user edits."""
+        schema_id, metadata = self._editor_metadata()
+        if not schema_id:
+            self.metadata_errors = []
+            self.schema_status_pane.object = ""
+            return
+        self._scheduler.schedule(
+            'validate',
+            lambda: validate_metadata(self.api, schema_id, metadata),
+            self._apply_validation,
+            on_error=self._on_validation_error
+        )
+
+    def _metadata_valid(self):
+        """Validate the editor metadata now, before a write; the last background result may be stale."""
+        schema_id, metadata = self._editor_metadata()
+        try:
+            errors = validate_metadata(self.api, schema_id, metadata)
+        except Exception as e:
+            self.record_output_pane.object = f"<h3>Error: Failed to validate metadata against its schema: {e}</h3>"
+            return False
+        self._apply_validation(errors)
+        if errors:
+            self.record_output_pane.object = "<h3>Error: Metadata does not match its schema</h3>"
+        return not errors
+
+    def _on_validation_error(self, error):
+        # Without the schema the server remains the one to validate
+        self.metadata_errors = []
+        self.schema_status_pane.object = f"Schema could not be loaded for local validation: {error}"
+
+    def _apply_validation(self, errors):
+        self.metadata_errors = errors
+        if errors:
+            items = "\n".join(f"- {error}" for error in errors[:20])
+            self.schema_status_pane.object = f"**Schema errors ({len(errors)}):**\n{items}"
+        else:
+            self.schema_status_pane.object = "Metadata matches its schema"
 
     def toggle_update_button_visibility(self, event):
         """Toggle the visibility of the update button based on metadata changes."""
         self.update_button.visible = self.metadata_changed
 
+    @profiled()
     def read_record(self, event):
         if not self.record_id:
             self.record_output_pane.object = "<h3>Warning: Record ID is required</h3>"
             return
         try:            
             if self.selected_context:
-                response = self.df_api.dataView(data_id=self.record_id, context=self.selected_context)
-                res = MessageToJson(response[0])
-                res_json = json.loads(res)
-
-                for record in res_json.get('data', []):
-                    if 'metadata' in record:
-                        try:
-                            record['metadata'] = json.loads(record['metadata'])
-                        except json.JSONDecodeError:
-                            pass
-
-                self.original_metadata = res_json['data'][0]['metadata']
+                res_json = self.service.read_record(self.record_id, self.selected_context)
+
+                self.original_record = res_json['data'][0]
                 self.metadata_json_editor.value = res_json
                 self.metadata_changed = False  # Reset the change flag after loading
 
@@ -239,141 +603,353 @@ class DataFedApp(param.Parameterized):
         except Exception as e:
             self.record_output_pane.object = f"<h3>Error: Failed to read record: {e}</h3>"
 
+    def compare_records(self, event=None):
+        """Load the chosen records in the background and show only the metadata keys that differ."""
+        record_ids = list(self.compare_ids)
+        if len(record_ids) < 2:
+            self.compare_status_pane.object = "<h3>Warning: Select at least two records to compare</h3>"
+            return
+        context = self.selected_context
+        self.compare_status_pane.object = f"<h3>Loading {len(record_ids)} records...</h3>"
+        self._scheduler.schedule(
+            'compare',
+            lambda: self._fetch_comparison(record_ids, context),
+            self._show_comparison,
+            on_error=self._on_compare_error
+        )
+
+    def _fetch_comparison(self, record_ids, context):
+        records = fetch_records(self.api, record_ids, context)
+        labels = [f"{record.get('title', '')} ({record['id']})" for record in records]
+        return len(records), compare_metadata(records, labels)
+
+    def _on_compare_error(self, error):
+        self.compare_status_pane.object = f"<h3>Error: Failed to compare records: {error}</h3>"
+
+    def _show_comparison(self, result):
+        count, table = result
+        self.compare_table.value = table
+        self.compare_status_pane.object = f"<h3>{len(table)} differing keys across {count} records</h3>"
+
     def update_record(self, event=None):
         if not self.record_id or not self.metadata_json_editor.value:
             self.record_output_pane.object = "<h3>Warning: Record ID and metadata are required</h3>"
             return
+        if not self._metadata_valid():
+            return
 
         try:
             if self.selected_context and self.metadata_changed:
-                self.df_api.setContext(self.selected_context)
-                
-                # Prepare parameters for the dataUpdate call
-                update_params = {
-                    'data_id': self.record_id,
-                    'metadata': None,
-                    'title': None,
-                    'alias': None,
-                    'description': None,
-                    'tags': None,
-                    'extension': None,
-                    'schema': None,
-                    'schema_enforce': None,
-                    'deps_add': None,
-                    'deps_rem': None,
-                    'raw_data_file': None,
-                    'context': self.selected_context
-                }
-
-                current_metadata = self.metadata_json_editor.value['data'][0]
-
-                # Compare fields and populate update_params with changes
-                if current_metadata.get('title') != self.original_metadata.get('title'):
-                    update_params['title'] = current_metadata.get('title')
-
-                if current_metadata.get('alias') != self.original_metadata.get('alias'):
-                    update_params['alias'] = current_metadata.get('alias')
-
-                if current_metadata.get('description') != self.original_metadata.get('description'):
-                    update_params['description'] = current_metadata.get('description')
-
-                if current_metadata.get('tags') != self.original_metadata.get('tags'):
-                    update_params['tags'] = current_metadata.get('tags')
-
-                if current_metadata.get('extension') != self.original_metadata.get('extension'):
-                    update_params['extension'] = current_metadata.get('extension')
-
-                if current_metadata.get('schema') != self.original_metadata.get('schema'):
-                    update_params['schema'] = current_metadata.get('schema')
-
-                if current_metadata.get('schema_enforce') != self.original_metadata.get('schema_enforce'):
-                    update_params['schema_enforce'] = current_metadata.get('schema_enforce')
-
-                if current_metadata.get('deps_add') != self.original_metadata.get('deps_add'):
-                    update_params['deps_add'] = current_metadata.get('deps_add')
-
-                if current_metadata.get('deps_rem') != self.original_metadata.get('deps_rem'):
-                    update_params['deps_rem'] = current_metadata.get('deps_rem')
-
-                if current_metadata.get('raw_data_file') != self.original_metadata.get('raw_data_file'):
-                    update_params['raw_data_file'] = current_metadata.get('raw_data_file')
-
-                # Check if metadata has changed
-                updated_metadata = self.get_changed_fields(self.original_metadata.get('metadata', {}), current_metadata.get('metadata', {}))
-                if updated_metadata:
-                    update_params['metadata'] = json.dumps(updated_metadata)
-
-                # Remove parameters that are None (not updated)
-                update_params = {k: v for k, v in update_params.items() if v is not None}
-                print(f"update_params:{update_params}")
-                if update_params:
-                    # Call the dataUpdate method with the updated parameters
-                    response = self.df_api.dataUpdate(**update_params)
+                current_record = self.metadata_json_editor.value['data'][0]
+                result = self.service.update_record(
+                    self.record_id, self.original_record, current_record, self.selected_context
+                )
+                if result.changed:
                     self.record_output_pane.object = f"<h3>Success: Record updated with new metadata</h3>"
+                    self.original_record = current_record
                     self.metadata_changed = False  # Reset the change flag after updating
                 else:
                     self.record_output_pane.object = f"<h3>No changes detected to update</h3>"
         except Exception as e:
             self.record_output_pane.object = f"<h3>Error: Failed to update record: {e}</h3>"
 
-    def get_changed_fields(self, original: dict, current: dict) -> dict:
-        """Compare original and current metadata, returning only changed fields."""
-        changed_fields = {}
-        for key, value in current.items():
-            if key not in original or original[key] != value:
-                changed_fields[key] = value
-        return changed_fields
-
     def delete_record(self, event):
         if not self.record_id:
             self.record_output_pane.object = "<h3>Warning: Record ID is required</h3>"
             return
         try:
-            if self.selected_context:
-                self.df_api.setContext(self.selected_context)
-            response = self.df_api.dataDelete(f"{self.record_id}")
+            record_id = self.record_id
+            job_id = self.service.submit_delete([record_id], self.selected_context, on_done=session_callback(self._on_delete_done))
             self.metadata_json_editor.value = {}  # Clear the JSON editor
-            self.original_metadata = {}  # Reset the original metadata tracking
-            self.record_output_pane.object = f"<h3>Success: Record :{self.record_id} successfully deleted  </h3>"
-            self.update_records()
-            self.record_id = None
+            self.original_record = {}  # Reset the original record tracking
+            self.record_output_pane.object = f"<h3>Delete of record :{record_id} queued as job {job_id}</h3>"
         except Exception as e:
             self.record_output_pane.object = f"<h3>Error: Failed to delete record: {e}</h3>"
 
+    def _on_delete_done(self, job):
+        record_ids = ', '.join(job['params']['record_ids'])
+        if job['state'] == DONE:
+            self._mirror.mirror.remove(self._user_key, job['params']['context'], job['params']['record_ids'])
+            self.record_output_pane.object = f"<h3>Success: Record :{record_ids} successfully deleted  </h3>"
+            self.collection_tree.reload()
+            self.update_records()
+        else:
+            self.record_output_pane.object = f"<h3>Error: Failed to delete record: {job['error']}</h3>"
+        self.refresh_jobs()
+
     def transfer_data(self, event):
         if not self.source_id or not self.dest_collection:
             self.record_output_pane.object = "<h3>Warning: Source ID and destination collection are required</h3>"
             return
         try:
-            if self.selected_context:
-                self.df_api.setContext(self.selected_context)
-            source_record = self.df_api.dataView(f"d/{self.source_id}")
-            source_details = source_record[0].data[0]
-            new_record = self.df_api.dataCreate(
-                title=source_details.title,
-                metadata=source_details.metadata,
-                parent=self.dest_collection
+            source_ids = self.source_id.replace(',', ' ').split()
+            job_id = self.service.submit_transfer(
+                source_ids,
+                self.available_collections.get(self.dest_collection, self.dest_collection),
+                self.selected_context,
+                dest_context=self.dest_context or None,
+                on_done=session_callback(self._on_transfer_done)
             )
-            new_record_id = new_record[0].data[0].id
-            self.df_api.dataMove(f"d/{self.source_id}", new_record_id)
-            self.record_output_pane.object = f"<h3>Success: Data transferred to new record ID: {new_record_id}</h3>"
+            self.record_output_pane.object = f"<h3>Transfer of {len(source_ids)} record(s) queued as job {job_id}</h3>"
         except Exception as e:
             self.record_output_pane.object = f"<h3>Error: Failed to transfer data: {e}</h3>"
 
+    def _on_transfer_done(self, job):
+        params = job['params']
+        if job['state'] != DONE:
+            self.record_output_pane.object = f"<h3>Error: Failed to transfer data: {job['error']}</h3>"
+        elif params['dest_context'] == params['context']:
+            self.record_output_pane.object = (
+                f"<h3>Success: {len(params['source_ids'])} record(s) moved to {params['dest_collection']}</h3>"
+            )
+            self.collection_tree.reload()
+            self.update_records()
+        else:
+            new_record_ids = [
+                record_id for step in job_queue.steps(job['id']) if step['name'].startswith('copy ')
+                for record_id in json.loads(step['result'])
+            ]
+            self.record_output_pane.object = (
+                f"<h3>Success: Metadata copied to new record IDs (raw data not transferred): {', '.join(new_record_ids)}</h3>"
+            )
+        self.refresh_jobs()
+
+    def export_metadata(self, event=None):
+        """Queue an export of the selected collection's metadata; the file is offered for download when done."""
+        coll_id = self.available_collections.get(self.selected_collection)
+        if not coll_id:
+            self.export_status_pane.object = "<h3>Warning: Context or Collection not selected</h3>"
+            return
+        try:
+            job_id = self.service.submit_export(
+                coll_id, export_path(coll_id, self.export_format), self.export_format,
+                context=self.selected_context, on_done=session_callback(self._on_export_done)
+            )
+            self.export_download.visible = False
+            self.export_status_pane.object = f"<h3>Export of {self.selected_collection} queued as job {job_id}</h3>"
+        except Exception as e:
+            self.export_status_pane.object = f"<h3>Error: Failed to export metadata: {e}</h3>"
+
+    def _on_export_done(self, job):
+        if job['state'] == DONE:
+            path = job['params']['path']
+            count = json.loads(job_queue.steps(job['id'])[-1]['result'])
+            self.export_download.file = path
+            self.export_download.filename = os.path.basename(path)
+            self.export_download.visible = True
+            self.export_status_pane.object = f"<h3>Success: Exported metadata of {count} records</h3>"
+        else:
+            self.export_status_pane.object = f"<h3>Error: Failed to export metadata: {job['error']}</h3>"
+        self.refresh_jobs()
+
+    def sync_directory(self, event=None):
+        """Queue a sync of the file selector's directory into the selected collection."""
+        coll_id = self.available_collections.get(self.selected_collection)
+        if not coll_id:
+            self.sync_status_pane.object = "<h3>Warning: Context or Collection not selected</h3>"
+            return
+        directory = self.file_selector.directory
+        try:
+            job_id = self.service.submit_sync_directory(
+                directory, coll_id, context=self.selected_context, pattern=self.file_selector.file_pattern,
+                schema=self.schema_id or None, on_done=session_callback(self._on_sync_done)
+            )
+            self.sync_status_pane.object = f"<h3>Sync of {directory} queued as job {job_id}</h3>"
+        except Exception as e:
+            self.sync_status_pane.object = f"<h3>Error: Failed to sync directory: {e}</h3>"
+
+    def _on_sync_done(self, job):
+        if job['state'] == DONE:
+            result = json.loads(job_queue.steps(job['id'])[-1]['result'])
+            status = (
+                f"<h3>Success: {result['created']} record(s) created, {result['updated']} updated, "
+                f"{result['deduplicated']} file(s) matched by content, {result['unchanged']} unchanged</h3>"
+            )
+            if result['errors']:
+                status += f"<h3>Warning: {len(result['errors'])} file(s) failed: {'; '.join(result['errors'][:5])}</h3>"
+            self.sync_status_pane.object = status
+            self.update_records()
+        else:
+            self.sync_status_pane.object = f"<h3>Error: Failed to sync directory: {job['error']}</h3>"
+        self.refresh_jobs()
+
+    def refresh_jobs(self):
+        """Render queued, running and finished job counts with per-job timings."""
+        counts = job_queue.counts()
+        lines = [
+            f"**Queued:** {counts[QUEUED]} &nbsp; **Running:** {counts[RUNNING]} &nbsp; "
+            f"**Done:** {counts[DONE]} &nbsp; **Failed:** {counts[FAILED]}",
+            "",
+            "| Job | Kind | State | Waited (s) | Ran (s) | Error |",
+            "|---|---|---|---|---|---|",
+        ]
+        for job in job_queue.recent():
+            run_time = f"{job['run_time']:.1f}" if job['run_time'] is not None else "-"
+            lines.append(
+                f"| {job['id']} | {job['kind']} | {job['state']} | {job['wait_time']:.1f} | {run_time} | {job['error'] or ''} |"
+            )
+        self.jobs_pane.object = "\n".join(lines)
+
+    def search_records(self, event=None):
+        """Run a server-side query and stream its result pages into the search table."""
+        if self.search_local:
+            return self.search_mirror()
+        query = {
+            'text': self.search_text or None,
+            'tags': [tag.strip() for tag in self.search_tags.split(',') if tag.strip()] or None,
+            'meta': self.search_metadata or None,
+        }
+        if self.search_in_collection and self.available_collections.get(self.selected_collection):
+            query['coll'] = [self.available_collections[self.selected_collection]]
+        else:
+            query['owner'] = self.selected_context
+        self._search_generation += 1
+        self.search_table.value = pd.DataFrame(columns=SEARCH_COLUMNS)
+        self.search_status_pane.object = "<h3>Searching...</h3>"
+        thread = threading.Thread(
+            target=self._run_search,
+            args=(query, self.search_page_size, self._search_generation, session_callback(self._show_search_page)),
+            daemon=True
+        )
+        thread.start()
+
+    def _run_search(self, query, page_size, generation, show):
+        """Fetch result pages on a background thread; ``show`` applies each one in the session."""
+        found = 0
+        try:
+            for offset in range(0, SEARCH_MAX_RESULTS, page_size):
+                if generation != self._search_generation:
+                    return  # A newer search has started
+                rows = self.query_page(query, offset, page_size)
+                if rows:
+                    found += len(rows)
+                    show(generation, rows, f"<h3>{found} records found so far...</h3>")
+                if len(rows) < page_size:
+                    break
+            show(generation, [], f"<h3>{found} records found</h3>")
+        except Exception as e:
+            show(generation, [], f"<h3>Error: Search failed: {e}</h3>")
+
+    def _show_search_page(self, generation, rows, status):
+        if generation != self._search_generation:
+            return
+        if rows:
+            self.search_table.stream(pd.DataFrame(rows, columns=SEARCH_COLUMNS))
+        self.search_status_pane.object = status
+
+    def search_mirror(self):
+        """Filter and sort the selected context's records in the local mirror."""
+        if not self._user_key or not self._mirror.mirror.status(self._user_key, self.selected_context):
+            self.search_status_pane.object = "<h3>Warning: The selected context is not mirrored locally</h3>"
+            return
+        try:
+            started = time.perf_counter()
+            rows = self._mirror.mirror.query(
+                self._user_key,
+                self.selected_context,
+                coll_id=self.available_collections.get(self.selected_collection) if self.search_in_collection else None,
+                text=self.search_text or None,
+                tags=[tag.strip() for tag in self.search_tags.split(',') if tag.strip()] or None,
+                filters=parse_filter(self.search_metadata),
+                sort=self.search_sort or 'title',
+                limit=SEARCH_MAX_RESULTS
+            )
+            elapsed = (time.perf_counter() - started) * 1000
+            self._search_generation += 1
+            self.search_table.value = pd.DataFrame(rows, columns=SEARCH_COLUMNS)
+            self.search_status_pane.object = f"<h3>{len(rows)} records found in the local mirror ({elapsed:.0f} ms)</h3>"
+        except Exception as e:
+            self.search_status_pane.object = f"<h3>Error: Local search failed: {e}</h3>"
+
+    def toggle_mirror(self, event):
+        if self._restoring or not self._user_key or not self.selected_context:
+            return
+        if event.new:
+            self._mirror.mirror.subscribe(self._user_key, self.selected_context)
+            self._mirror.attach(self._session_id, self._user_key, self.api)
+        else:
+            self._mirror.mirror.unsubscribe(self._user_key, self.selected_context)
+        self.refresh_mirror_status()
+
+    def refresh_mirror_status(self, event=None):
+        status = self._mirror.mirror.status(self._user_key, self.selected_context) if self._user_key else None
+        if self.mirror_context != bool(status):
+            with param.discard_events(self):
+                self.mirror_context = bool(status)
+        if status is None:
+            self.mirror_status_pane.object = ""
+        elif status['error']:
+            self.mirror_status_pane.object = f"**Local mirror:** {status['records']} records, last sync failed: {status['error']}"
+        elif status['synced']:
+            age = time.time() - status['synced']
+            self.mirror_status_pane.object = f"**Local mirror:** {status['records']} records, synced {age:.0f} s ago"
+        else:
+            self.mirror_status_pane.object = "**Local mirror:** initial sync in progress"
+
+    def query_page(self, query, offset, count):
+        """Return one page of query results, served from the query cache when possible."""
+        return self.service.search(query, offset, count, user=self.current_user)
+
+    def on_search_result_click(self, event):
+        self.record_id = self.search_table.value.iloc[event.row]['id']
+        self.read_record(event)
+
+    @property
+    def profile_user(self):
+        return self._user_key
+
+    def profiling_panel(self, current_user):
+        """Profiling controls, shown only to the users listed in ``PROFILING_ADMINS``."""
+        if not self._user_key or not profiling.is_admin(self._user_key):
+            return pn.pane.Markdown("Profiling is available to administrators only")
+        self.refresh_profiling()
+        return pn.Column(
+            pn.Row(self.profile_user_select, self.profile_refresh_button, self.profile_start_button, self.profile_stop_button),
+            self.profile_summary_pane,
+            pn.Row(self.profile_stacks_download, self.profile_report_download)
+        )
+
+    def refresh_profiling(self, event=None):
+        self.profile_user_select.options = sorted(set(profiling.sessions()) | set(profiling.profilers))
+        profiler = profiling.profilers.get(self.profile_user_select.value)
+        self.profile_summary_pane.object = profiler.summary_markdown() if profiler else "Not profiled yet"
+
+    def start_profiling(self, event=None):
+        if profiling.is_admin(self._user_key) and self.profile_user_select.value:
+            profiling.start(self.profile_user_select.value)
+            self.refresh_profiling()
+
+    def stop_profiling(self, event=None):
+        if profiling.is_admin(self._user_key) and self.profile_user_select.value:
+            profiling.stop(self.profile_user_select.value)
+            self.refresh_profiling()
+
+    def _profile_file(self, render):
+        profiler = profiling.profilers.get(self.profile_user_select.value)
+        return io.StringIO(render(profiler) if profiler and profiling.is_admin(self._user_key) else "")
+
+    def refresh_api_status(self):
+        """Show the circuit breaker state in the header and its counters in the metrics pane."""
+        stats = breaker.stats()
+        badges = {'closed': '🟢 DataFed OK', 'half-open': '🟡 DataFed recovering', 'open': '🔴 DataFed unavailable'}
+        self.api_status_pane.object = f"**{badges[stats['state']]}**"
+        self.api_metrics_pane.object = (
+            f"**DataFed API:** breaker {stats['state']} &nbsp; calls {stats['calls']} &nbsp; "
+            f"failures {stats['failures']} &nbsp; timeouts {stats['timeouts']} &nbsp; "
+            f"retries {stats['retries']} &nbsp; rejected {stats['rejected']}"
+        )
+
     def get_projects(self, event):
         try:
-            response = self.df_api.projectList()
-            projects = response[0].item
-            projects_list = [{"id": project.id, "title": project.title} for project in projects]
-            self.projects_json_pane.object = projects_list
+            projects_list = [{"id": context.id, "title": context.title} for context in self.service.contexts()]
+            self.projects_json_pane.value = projects_list
         except Exception as e:
-            self.projects_json_pane.object = {"error": str(e)}
+            self.projects_json_pane.value = {"error": str(e)}
 
     def get_available_contexts(self):
         try:
-            response = self.df_api.projectList()
-            projects = response[0].item
-            return [project.id for project in projects],[project.title for project in projects]
+            contexts = self.service.contexts()
+            return [context.id for context in contexts], [context.title for context in contexts]
         except Exception as e:
             return [f"Error: {e}"]
 
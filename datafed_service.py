@@ -0,0 +1,423 @@
+from __future__ import annotations
+import json
+import os
+import tempfile
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from cache import LRUCache
+from client_pool import close as close_clients, map_clients, rekey
+from collection_listing import invalidate_collection, labelled, list_child_collections
+from dir_sync import SyncResult, sync_directory
+from export import export_collection
+from job_queue import get_job_queue
+from metadata_encoding import encode_metadata, payload_report
+from provenance import invalidate_node
+from record_compare import invalidate_record, view_record
+from resilience import ResilientAPI
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))
+SEARCH_COLUMNS = ['id', 'title', 'alias', 'owner']
+TRANSFER_BATCH_SIZE = 100
+DELETE_BATCH_SIZE = 50
+# Batch create/update requests are capped by the client at API._max_payload_size (1 MiB)
+BATCH_MAX_BYTES = int(os.getenv("DATAFED_BATCH_MAX_BYTES", str(1024 * 1024 - 4096)))
+BATCH_MAX_RECORDS = int(os.getenv("DATAFED_BATCH_MAX_RECORDS", "500"))
+
+# Editable record fields and the dataUpdate argument each one maps to
+UPDATE_FIELDS = {
+    'title': 'title',
+    'alias': 'alias',
+    'desc': 'description',
+    'description': 'description',
+    'tags': 'tags',
+    'extension': 'extension',
+    'schema': 'schema',
+    'schema_enforce': 'schema_enforce',
+    'deps_add': 'deps_add',
+    'deps_rem': 'deps_rem',
+    'raw_data_file': 'raw_data_file',
+}
+
+# Query result pages, shared by all sessions and keyed by user so permissions are respected
+search_cache = LRUCache(maxsize=256, ttl=SEARCH_CACHE_TTL)
+
+
+@dataclass
+class Context:
+    id: str
+    title: str
+
+
+@dataclass
+class CreateResult:
+    id: str
+    report: dict
+
+
+@dataclass
+class UpdateResult:
+    id: str
+    fields: List[str]
+    report: Optional[dict] = None
+
+    @property
+    def changed(self):
+        return bool(self.fields)
+
+
+@dataclass
+class BatchResult:
+    ids: List[str] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    batches: int = 0
+
+
+def _transfer_job(api, params, step):
+    """Relocate records to ``dest_collection``.
+
+    Within one context the records are linked into the destination, one request per
+    batch of IDs, and unlinked from every collection they were in before, as reported by
+    ``collectionGetParents``. DataFed has no bulk form of that call, so a batch's lookups
+    run in parallel over the session's client pool. When the destination lives in another
+    context only the records' metadata, title, description and tags are copied: each
+    batch is viewed over the client pool and created with ``dataBatchCreate``; the raw
+    data stays where it is.
+    """
+    context = params.get('context')
+    dest_context = params.get('dest_context') or context
+    source_ids = params['source_ids']
+    dest_collection = params['dest_collection']
+
+    if dest_context == context:
+        for start in range(0, len(source_ids), TRANSFER_BATCH_SIZE):
+            batch = source_ids[start:start + TRANSFER_BATCH_SIZE]
+
+            def link(batch=batch):
+                api.collectionItemsUpdate(dest_collection, add_ids=batch, context=context)
+                for record_id in batch:
+                    invalidate_record(record_id)
+
+            def unlink(batch=batch):
+                paths = map_clients(
+                    api, lambda client, record_id: client.collectionGetParents(record_id, context=context)[0].path, batch
+                )
+                by_parent = {}
+                for record_id, record_paths in zip(batch, paths):
+                    for path in record_paths:
+                        parent_id = path.item[0].id if path.item else None
+                        if parent_id and parent_id != dest_collection:
+                            by_parent.setdefault(parent_id, []).append(record_id)
+                for parent_id, record_ids in by_parent.items():
+                    api.collectionItemsUpdate(parent_id, rem_ids=record_ids, context=context)
+
+            step(f"link {start}", link)
+            step(f"unlink {start}", unlink)
+        # Collections can be moved too
+        invalidate_collection(context)
+        search_cache.clear()
+        return source_ids
+
+    new_record_ids = []
+    for start in range(0, len(source_ids), TRANSFER_BATCH_SIZE):
+        batch = source_ids[start:start + TRANSFER_BATCH_SIZE]
+
+        def copy(batch=batch):
+            sources = map_clients(api, lambda client, source_id: client.dataView(source_id, context=context)[0].data[0], batch)
+            texts = (
+                _record_json(
+                    {'title': source.title, **({'desc': source.desc} if source.desc else {}),
+                     **({'tags': list(source.tags)} if source.tags else {})},
+                    source.metadata or None
+                )
+                for source in sources
+            )
+            result = DataFedService(api)._send_batches(
+                texts, lambda path: api.dataBatchCreate([path], coll_id=dest_collection, context=dest_context)
+            )
+            if result.errors:
+                raise RuntimeError(f"Copied {len(result.ids)} of {len(batch)} record(s): {'; '.join(result.errors)}")
+            return result.ids
+
+        new_record_ids += step(f"copy {start}", copy)
+    invalidate_collection(dest_context)
+    search_cache.clear()
+    return new_record_ids
+
+
+def _delete_job(api, params, step):
+    record_ids = params['record_ids']
+    batch_size = params.get('batch_size', DELETE_BATCH_SIZE)
+    for start in range(0, len(record_ids), batch_size):
+        batch = record_ids[start:start + batch_size]
+
+        def delete(batch=batch):
+            api.dataDelete(batch, context=params.get('context'))
+            for record_id in batch:
+                invalidate_record(record_id)
+                invalidate_node(record_id)
+
+        step(f"delete {start}", delete)
+    invalidate_collection(params.get('context'))
+    search_cache.clear()
+
+
+def _export_job(api, params, step):
+    return step('export', lambda: export_collection(
+        api, params['coll_id'], params['path'], fmt=params['format'], context=params.get('context')
+    ))
+
+
+def _dir_sync_job(api, params, step):
+    return step('sync', lambda: DataFedService(api).sync_directory(
+        params['directory'], params['coll_id'], context=params.get('context'),
+        pattern=params.get('pattern', '*'), schema=params.get('schema')
+    ).as_dict())
+
+
+job_queue = get_job_queue()
+job_queue.register('transfer', _transfer_job)
+job_queue.register('delete', _delete_job)
+job_queue.register('export', _export_job)
+job_queue.register('dir_sync', _dir_sync_job)
+
+
+def _record_json(record, metadata_payload=None):
+    """Serialise one batch record, splicing in already encoded metadata without re-parsing it."""
+    text = json.dumps({key: value for key, value in record.items() if key != 'metadata'})
+    if metadata_payload is None:
+        return text
+    return f'{text[:-1]}, "md": {metadata_payload}}}' if text != '{}' else f'{{"md": {metadata_payload}}}'
+
+
+def _batches(texts, max_bytes=BATCH_MAX_BYTES, max_records=BATCH_MAX_RECORDS):
+    """Group serialised records into JSON arrays no larger than ``max_bytes``; yields ``(indexes, texts)``."""
+    indexes, batch, size = [], [], 2
+    for index, text in enumerate(texts):
+        length = len(text.encode('utf-8')) + 2
+        if batch and (size + length > max_bytes or len(batch) == max_records):
+            yield indexes, batch
+            indexes, batch, size = [], [], 2
+        indexes.append(index)
+        batch.append(text)
+        size += length
+    if batch:
+        yield indexes, batch
+
+
+class DataFedService:
+    """DataFed operations without any UI: results are returned, failures are raised.
+
+    Used by :class:`datafed_app.DataFedApp` and by the command line in ``cli.py``. All
+    server calls go through :class:`resilience.ResilientAPI`.
+    """
+
+    def __init__(self, api=None):
+        if api is None:
+            from datafed.CommandLib import API
+            api = API()
+        self.api = api if isinstance(api, ResilientAPI) else ResilientAPI(api)
+
+    def user(self):
+        return self.api.getAuthUser()
+
+    def login(self, username, password):
+        # A login bound to known keys lets the client pool open more connections for this user
+        rekey(self.api)
+        self.api.loginByPassword(username, password)
+        return self.api.getAuthUser()
+
+    def resume_jobs(self) -> List[str]:
+        """Resume this user's jobs that a server restart interrupted; returns their IDs."""
+        return job_queue.adopt(self.api)
+
+    def close(self):
+        """Release the extra connections opened for this client (see :mod:`client_pool`)."""
+        close_clients(self.api)
+
+    def logout(self):
+        self.close()
+        self.api.logout()
+
+    def contexts(self) -> List[Context]:
+        """Projects the user can work in."""
+        return [Context(project.id, project.title) for project in self.api.projectList()[0].item]
+
+    def collections(self, context) -> Dict[str, str]:
+        """Top-level collections of ``context`` by title (with the ID when titles repeat), plus ``root``."""
+        self.api.setContext(context)
+        collections = labelled(list_child_collections(self.api, 'root', context))
+        collections['root'] = 'root'
+        return collections
+
+    def records(self, coll_id, context) -> Dict[str, str]:
+        """Records directly in ``coll_id`` by title."""
+        items_list = self.api.collectionItemsList(coll_id=coll_id, context=context)
+        return {item.title: item.id for item in items_list[0].item if item.id.startswith("d/")}
+
+    def read_record(self, record_id, context) -> dict:
+        """Decoded ``dataView`` reply, fetched live so permissions and edits from other clients apply."""
+        return view_record(self.api, record_id, context)
+
+    def create_record(self, title, metadata, parent_id='root', context=None, schema=None) -> CreateResult:
+        if not title or not metadata:
+            raise ValueError("Title and metadata are required")
+        if context:
+            self.api.setContext(context)
+        payload = encode_metadata(metadata)
+        schema_params = {'schema': schema} if schema else {}
+        # Passed explicitly as well: a job thread may switch the client's context in between
+        response = self.api.dataCreate(title=title, metadata=payload, parent_id=parent_id, context=context, **schema_params)
+        search_cache.clear()
+        return CreateResult(response[0].data[0].id, payload_report(payload))
+
+    def record_changes(self, original, current) -> dict:
+        """Return the ``dataUpdate`` arguments for the fields and metadata keys changed from ``original`` to ``current``."""
+        changes = {}
+        for name, argument in UPDATE_FIELDS.items():
+            if name in current and current.get(name) != original.get(name):
+                changes[argument] = current.get(name)
+        original_metadata = original.get('metadata') or {}
+        metadata = {
+            key: value for key, value in (current.get('metadata') or {}).items()
+            if key not in original_metadata or original_metadata[key] != value
+        }
+        if metadata:
+            changes['metadata'] = metadata
+        return changes
+
+    def update_record(self, record_id, original, current, context) -> UpdateResult:
+        """Send only what changed between two versions of a record (as returned by :meth:`read_record`)."""
+        changes = {key: value for key, value in self.record_changes(original, current).items() if value is not None}
+        if not changes:
+            return UpdateResult(record_id, [])
+        return self._update(record_id, changes, context)
+
+    def update_metadata(self, record_id, metadata, context=None, replace=False) -> UpdateResult:
+        """Merge ``metadata`` into a record's metadata, or replace it when ``replace`` is set."""
+        return self._update(record_id, {'metadata': metadata, 'metadata_set': replace}, context)
+
+    def _update(self, record_id, changes, context):
+        report = None
+        if 'metadata' in changes:
+            changes['metadata'] = encode_metadata(changes['metadata'])
+            report = payload_report(changes['metadata'])
+        if context:
+            self.api.setContext(context)
+        self.api.dataUpdate(data_id=record_id, context=context, **changes)
+        search_cache.clear()
+        invalidate_record(record_id)
+        # Both ends of a changed dependency list it
+        for dep_id in [record_id] + [dep[1] for key in ('deps_add', 'deps_rem') for dep in changes.get(key) or []]:
+            invalidate_node(dep_id)
+        return UpdateResult(record_id, sorted(key for key in changes if key != 'metadata_set'), report)
+
+    def submit_delete(self, record_ids, context, on_done=None) -> str:
+        """Queue the deletion of ``record_ids``; returns the job ID."""
+        return job_queue.submit('delete', {'record_ids': list(record_ids), 'context': context}, api=self.api, on_done=on_done)
+
+    def submit_transfer(self, record_ids, dest_collection, context, dest_context=None, on_done=None) -> str:
+        """Queue moving ``record_ids`` to ``dest_collection`` (across contexts, copying their metadata); returns the job ID."""
+        record_ids = [rid if rid.startswith('d/') else f"d/{rid}" for rid in record_ids]
+        return job_queue.submit(
+            'transfer',
+            {
+                'source_ids': record_ids,
+                'dest_collection': dest_collection,
+                'context': context,
+                'dest_context': dest_context or context,
+            },
+            api=self.api,
+            on_done=on_done
+        )
+
+    def export(self, coll_id, path, fmt='csv', context=None) -> int:
+        """Export the metadata of a collection now; returns the number of records written."""
+        return export_collection(self.api, coll_id, path, fmt=fmt, context=context)
+
+    def submit_export(self, coll_id, path, fmt='csv', context=None, on_done=None) -> str:
+        return job_queue.submit(
+            'export', {'coll_id': coll_id, 'context': context, 'format': fmt, 'path': path},
+            api=self.api, on_done=on_done
+        )
+
+    def sync_directory(self, directory, coll_id, context=None, pattern='*', schema=None) -> SyncResult:
+        """Create or update records for the new and changed files under ``directory``; see :func:`dir_sync.sync_directory`."""
+        return sync_directory(self, directory, coll_id, context=context, pattern=pattern, schema=schema)
+
+    def submit_sync_directory(self, directory, coll_id, context=None, pattern='*', schema=None, on_done=None) -> str:
+        return job_queue.submit(
+            'dir_sync',
+            {'directory': directory, 'coll_id': coll_id, 'context': context, 'pattern': pattern, 'schema': schema},
+            api=self.api, on_done=on_done
+        )
+
+    def search(self, query, offset, count, user=None) -> List[dict]:
+        """One page of ``queryDirect`` results, served from the query cache when possible."""
+        key = (user or self.user(), json.dumps(query, sort_keys=True), offset, count)
+        rows = search_cache.get(key)
+        if rows is None:
+            response = self.api.queryDirect(offset=offset, count=count, **query)
+            rows = [{column: getattr(item, column, '') for column in SEARCH_COLUMNS} for item in response[0].item]
+            search_cache.set(key, rows)
+        return rows
+
+    def batch_create(self, records, coll_id=None, context=None, schema=None, on_batch=None) -> BatchResult:
+        """Create many records with ``dataBatchCreate``.
+
+        ``records`` are dicts of DataFed record fields (``title``, ``alias``, ``desc``,
+        ``tags``, ...) with the metadata under ``metadata``. They are packed into requests
+        just under the client's payload limit and the requests are sent one after another.
+        After each successful request ``on_batch(indexes, ids)`` is called with the
+        positions of its records in ``records`` and the IDs DataFed returned for them.
+        """
+        def texts():
+            for record in records:
+                payload = encode_metadata(record['metadata']) if record.get('metadata') is not None else None
+                if schema and 'sch_id' not in record:
+                    record = dict(record, sch_id=schema)
+                yield _record_json(record, payload)
+
+        result = self._send_batches(
+            texts(), lambda path: self.api.dataBatchCreate([path], coll_id=coll_id, context=context), on_batch
+        )
+        search_cache.clear()
+        return result
+
+    def batch_update(self, records, context=None, on_batch=None) -> BatchResult:
+        """Update many records with ``dataBatchUpdate``; each dict needs an ``id`` and the fields to change.
+
+        ``on_batch`` is called as for :meth:`batch_create`.
+        """
+        def texts():
+            for record in records:
+                invalidate_record(record['id'])
+                payload = encode_metadata(record['metadata']) if record.get('metadata') is not None else None
+                yield _record_json(record, payload)
+
+        result = self._send_batches(texts(), lambda path: self.api.dataBatchUpdate([path]), on_batch)
+        search_cache.clear()
+        return result
+
+    def _send_batches(self, texts, send, on_batch=None):
+        result = BatchResult()
+
+        def send_batch(batch):
+            with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8') as f:
+                f.write('[' + ', '.join(batch) + ']')
+            try:
+                return [record.id for record in send(f.name)[0].data]
+            finally:
+                os.unlink(f.name)
+
+        # Batches are sent one at a time: a CommandLib client cannot carry concurrent requests
+        for indexes, batch in _batches(texts):
+            result.batches += 1
+            try:
+                ids = send_batch(batch)
+            except Exception as e:
+                result.errors.append(str(e))
+                continue
+            result.ids += ids
+            if on_batch is not None:
+                on_batch(indexes, ids)
+        return result
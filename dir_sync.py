@@ -0,0 +1,277 @@
+from __future__ import annotations
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from fnmatch import fnmatch
+from typing import List
+from extractors import extract_metadata, supported_extensions
+
+DIR_SYNC_DB_PATH = os.getenv("DIR_SYNC_DB_PATH", os.path.join(os.path.expanduser("~"), ".datafed_panel", "dir_sync.db"))
+DIR_SYNC_HASH_WORKERS = int(os.getenv("DIR_SYNC_HASH_WORKERS", "8"))
+DIR_SYNC_EXTRACT_WORKERS = int(os.getenv("DIR_SYNC_EXTRACT_WORKERS", "4"))
+DIR_SYNC_EXTRACT_CHUNK = 64
+HASH_CHUNK_SIZE = 1 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    context TEXT NOT NULL,
+    coll_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    record_id TEXT NOT NULL,
+    synced REAL NOT NULL,
+    PRIMARY KEY (context, coll_id, path)
+);
+CREATE INDEX IF NOT EXISTS files_hash ON files (context, coll_id, hash);
+"""
+
+
+@dataclass
+class SyncResult:
+    scanned: int = 0
+    unchanged: int = 0
+    hashed: int = 0
+    created: int = 0
+    updated: int = 0
+    deduplicated: int = 0
+    missing: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def as_dict(self):
+        return asdict(self)
+
+
+class Manifest:
+    """What has been synced to each collection: ``(path, size, mtime, content hash) -> record ID``.
+
+    A file whose size and modification time match its entry is not read again. Entries
+    of deleted files are kept, so a file that reappears, renamed or copied, is matched to
+    its record by content hash instead of being uploaded again.
+    """
+
+    def __init__(self, path=DIR_SYNC_DB_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and is closed when the block ends."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def entries(self, context, coll_id):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM files WHERE context=? AND coll_id=?", (context or '', coll_id))
+            return {row['path']: dict(row) for row in rows}
+
+    def save(self, context, coll_id, rows):
+        """Record ``[(path, size, mtime_ns, hash, record_id), ...]`` as synced."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(context or '', coll_id, *row, now) for row in rows]
+            )
+
+    def forget(self, context, coll_id, directory=None):
+        """Drop the entries of ``coll_id``, or only those under ``directory``."""
+        with self._connect() as conn:
+            if directory is None:
+                conn.execute("DELETE FROM files WHERE context=? AND coll_id=?", (context or '', coll_id))
+            else:
+                prefix = os.path.join(os.path.abspath(directory), '')
+                conn.execute(
+                    "DELETE FROM files WHERE context=? AND coll_id=? AND substr(path, 1, ?)=?",
+                    (context or '', coll_id, len(prefix), prefix)
+                )
+
+
+def file_hash(path, chunk_size=HASH_CHUNK_SIZE):
+    """BLAKE2b digest of the file, read into one reused buffer so memory does not grow with file size."""
+    digest = hashlib.blake2b()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])  # releases the GIL, so files hash in parallel
+    return digest.hexdigest()
+
+
+def scan_directory(directory, pattern='*'):
+    """Yield ``(path, size, mtime_ns)`` for the supported files under ``directory``; hidden entries are skipped."""
+    extensions = set(supported_extensions())
+    stack = [os.path.abspath(directory)]
+    while stack:
+        try:
+            entries = list(os.scandir(stack.pop()))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif (
+                os.path.splitext(entry.name)[1].lower() in extensions
+                and fnmatch(entry.name, pattern) and entry.is_file()
+            ):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                yield entry.path, stat.st_size, stat.st_mtime_ns
+
+
+def _hash_files(files, result, workers=DIR_SYNC_HASH_WORKERS):
+    """Return ``[(path, size, mtime_ns, hash), ...]`` for the files that could be read."""
+    def hash_file(path):
+        try:
+            return file_hash(path)
+        except OSError as e:
+            return e
+
+    hashed = []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dir-sync-hash') as executor:
+        for (path, size, mtime_ns), digest in zip(files, executor.map(hash_file, [f[0] for f in files])):
+            if isinstance(digest, OSError):
+                result.errors.append(f"{path}: {digest}")
+            else:
+                hashed.append((path, size, mtime_ns, digest))
+    result.hashed = len(hashed)
+    return hashed
+
+
+def _extracted(rows, result, workers=DIR_SYNC_EXTRACT_WORKERS):
+    """Yield ``(row, metadata)``, extracting ``DIR_SYNC_EXTRACT_CHUNK`` files at a time in parallel."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dir-sync-extract') as executor:
+        for start in range(0, len(rows), DIR_SYNC_EXTRACT_CHUNK):
+            chunk = rows[start:start + DIR_SYNC_EXTRACT_CHUNK]
+            futures = [executor.submit(extract_metadata, row[0]) for row in chunk]
+            for row, future in zip(chunk, futures):
+                try:
+                    yield row, future.result()
+                except Exception as e:
+                    result.errors.append(f"{row[0]}: {e}")
+
+
+def sync_directory(service, directory, coll_id, context=None, pattern='*', schema=None, manifest=None):
+    """Create or update one record in ``coll_id`` per new or changed file under ``directory``.
+
+    Only files whose size or modification time differ from the manifest are hashed, in
+    parallel. A file whose content is already in the collection is mapped to the existing
+    record; the others are sent with ``service.batch_create`` and ``batch_update`` (a
+    :class:`datafed_service.DataFedService`), and the manifest is saved after every
+    request, so an interrupted sync resumes where it stopped.
+    """
+    manifest = manifest or get_manifest()
+    result = SyncResult()
+    entries = manifest.entries(context, coll_id)
+
+    changed, seen = [], set()
+    for path, size, mtime_ns in scan_directory(directory, pattern):
+        seen.add(path)
+        entry = entries.get(path)
+        if entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            result.unchanged += 1
+        else:
+            changed.append((path, size, mtime_ns))
+    result.scanned = len(seen)
+    prefix = os.path.join(os.path.abspath(directory), '')
+    result.missing = sum(1 for path in entries if path.startswith(prefix) and path not in seen)
+    if not changed:
+        return result
+
+    by_hash = {entry['hash']: entry['record_id'] for entry in entries.values()}
+    shared = Counter(entry['record_id'] for entry in entries.values())
+    touched, creates, updates = [], [], []
+    duplicates = {}  # Files with the same content as a file created in this sync
+    for path, size, mtime_ns, digest in _hash_files(changed, result):
+        entry = entries.get(path)
+        if entry is not None and entry['hash'] == digest:
+            touched.append((path, size, mtime_ns, digest, entry['record_id']))
+        elif digest in by_hash:
+            touched.append((path, size, mtime_ns, digest, by_hash[digest]))
+            result.deduplicated += 1
+        elif digest in duplicates:
+            duplicates[digest].append((path, size, mtime_ns, digest))
+            result.deduplicated += 1
+        elif entry is not None and shared[entry['record_id']] == 1:
+            updates.append((path, size, mtime_ns, digest, entry['record_id']))
+        else:
+            duplicates[digest] = []
+            creates.append((path, size, mtime_ns, digest))
+    manifest.save(context, coll_id, touched)
+
+    sent = []
+
+    def new_records():
+        for row, metadata in _extracted(creates, result):
+            sent.append(row)
+            yield {'title': os.path.basename(row[0]), 'metadata': metadata}
+
+    def on_created(indexes, ids):
+        if len(ids) != len(indexes):
+            result.errors.append(f"dataBatchCreate returned {len(ids)} IDs for {len(indexes)} records")
+            return
+        rows = []
+        for index, record_id in zip(indexes, ids):
+            row = sent[index]
+            rows.append(row + (record_id,))
+            rows += [duplicate + (record_id,) for duplicate in duplicates[row[3]]]
+        manifest.save(context, coll_id, rows)
+        result.created += len(ids)
+
+    if creates:
+        batch = service.batch_create(new_records(), coll_id=coll_id, context=context, schema=schema, on_batch=on_created)
+        result.errors += batch.errors
+
+    updated = []
+
+    def changed_records():
+        for row, metadata in _extracted(updates, result):
+            updated.append(row)
+            # The file was replaced, so its metadata replaces the record's instead of being merged
+            yield {'id': row[4], 'metadata': metadata, 'mdset': True}
+
+    def on_updated(indexes, ids):
+        manifest.save(context, coll_id, [updated[index] for index in indexes])
+        result.updated += len(indexes)
+
+    if updates:
+        batch = service.batch_update(changed_records(), context=context, on_batch=on_updated)
+        result.errors += batch.errors
+    return result
+
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+
+def get_manifest():
+    """Return the process-wide sync manifest."""
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = Manifest()
+        return _manifest
@@ -0,0 +1,182 @@
+from __future__ import annotations
+import csv
+import json
+import os
+import tempfile
+import time
+import uuid
+from importlib.util import find_spec
+from itertools import islice
+from client_pool import map_clients
+from record_compare import flatten_metadata, view_record
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.expanduser("~"), ".datafed_panel", "exports"))
+EXPORT_PAGE_SIZE = 500
+# Records viewed in parallel before their rows are written
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "100"))
+# Files in EXPORT_DIR older than this many seconds are deleted when a new export starts
+EXPORT_TTL = float(os.getenv("EXPORT_TTL", "86400"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+
+# Record fields exported ahead of the flattened metadata columns
+RECORD_COLUMNS = ['id', 'title', 'alias', 'owner', 'creator', 'ct', 'ut', 'size']
+
+# pyarrow is optional and only imported by a Parquet export
+EXPORT_FORMATS = ['csv', 'parquet'] if find_spec('pyarrow') is not None else ['csv']
+
+
+def purge_exports(directory=EXPORT_DIR, ttl=EXPORT_TTL):
+    """Delete files in ``directory`` last modified more than ``ttl`` seconds ago."""
+    cutoff = time.time() - ttl
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+        except OSError:
+            pass  # Removed by another process, or still being written
+
+
+def export_path(coll_id, fmt, directory=EXPORT_DIR):
+    """Return a new, unique path in ``directory`` for an export of ``coll_id``, purging expired exports first."""
+    purge_exports(directory)
+    return os.path.join(
+        directory, f"{coll_id.replace('/', '_')}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.{fmt}"
+    )
+
+
+def iter_record_ids(api, coll_id, context=None, page_size=EXPORT_PAGE_SIZE):
+    """Yield the IDs of the records directly in ``coll_id``, one listing page at a time."""
+    offset = 0
+    while True:
+        items = api.collectionItemsList(coll_id, offset=offset, count=page_size, context=context)[0].item
+        for item in items:
+            if item.id.startswith("d/"):
+                yield item.id
+        if len(items) < page_size:
+            return
+        offset += page_size
+
+
+def iter_records(api, record_ids, context=None, batch_size=EXPORT_BATCH_SIZE):
+    """Yield decoded records in order, without going through the record cache.
+
+    The IDs are taken ``batch_size`` at a time and each batch is viewed in parallel over
+    the session's client pool (see :func:`client_pool.map_clients`).
+    """
+    record_ids = iter(record_ids)
+    while True:
+        batch = list(islice(record_ids, batch_size))
+        if not batch:
+            return
+        yield from map_clients(api, lambda client, record_id: view_record(client, record_id, context)['data'][0], batch)
+
+
+def flatten_record(record):
+    """Return one table row: the record fields followed by ``metadata.<dotted key>`` columns."""
+    row = {column: record.get(column) for column in RECORD_COLUMNS if column in record}
+    metadata = record.get('metadata')
+    if metadata is not None:
+        for key, value in flatten_metadata(metadata):
+            row[f"metadata.{key}"] = json.dumps(value) if isinstance(value, (dict, list)) else value
+    return row
+
+
+def _kind(value):
+    if isinstance(value, bool):
+        return 'bool'
+    if isinstance(value, int):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'str'
+
+
+def _spill(rows, spool):
+    """Write ``rows`` as JSON lines to ``spool``; return the columns in first-seen order with their value kinds."""
+    columns = {}
+    count = 0
+    for row in rows:
+        spool.write(json.dumps(row))
+        spool.write('\n')
+        for key, value in row.items():
+            if value is not None:
+                columns.setdefault(key, set()).add(_kind(value))
+            else:
+                columns.setdefault(key, set())
+        count += 1
+    return columns, count
+
+
+def _chunks(spool, size=EXPORT_CHUNK_ROWS):
+    spool.seek(0)
+    chunk = []
+    for line in spool:
+        chunk.append(json.loads(line))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _write_csv(spool, columns, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(columns))
+        writer.writeheader()
+        for chunk in _chunks(spool):
+            writer.writerows(chunk)
+
+
+def _arrow_type(kinds):
+    import pyarrow as pa
+    if kinds == {'bool'}:
+        return pa.bool_()
+    if kinds == {'int'}:
+        return pa.int64()
+    if kinds and kinds <= {'int', 'float'}:
+        return pa.float64()
+    return pa.string()
+
+
+def _write_parquet(spool, columns, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(name, _arrow_type(kinds)) for name, kinds in columns.items()])
+    as_text = {field.name for field in schema if field.type == pa.string()}
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in _chunks(spool):
+            data = {
+                name: [
+                    str(row.get(name)) if name in as_text and row.get(name) is not None else row.get(name)
+                    for row in chunk
+                ]
+                for name in columns
+            }
+            writer.write_table(pa.Table.from_pydict(data, schema=schema))
+
+
+def export_collection(api, coll_id, path, fmt='csv', context=None):
+    """Export the metadata of every record in ``coll_id`` to a CSV or Parquet file.
+
+    Records are fetched one at a time and spilled as JSON lines to a temporary
+    file while the set of columns is collected; the file is then written in chunks of
+    ``EXPORT_CHUNK_ROWS`` rows, so memory stays bounded whatever the collection size.
+    Returns the number of exported records.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}', expected one of {EXPORT_FORMATS}")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    rows = (flatten_record(record) for record in iter_records(api, iter_record_ids(api, coll_id, context), context))
+    with tempfile.TemporaryFile('w+', encoding='utf-8') as spool:
+        columns, count = _spill(rows, spool)
+        if fmt == 'parquet':
+            _write_parquet(spool, columns, path)
+        else:
+            _write_csv(spool, columns, path)
+    return count
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import csv
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+
+EXTRACTOR_WORKERS = int(os.getenv("EXTRACTOR_WORKERS", "4"))
+MAGIC_BYTES = 8
+
+# Extracted metadata keyed by (path, size, mtime, header_only); shared by all sessions
+metadata_cache = LRUCache(maxsize=512)
+_executor = ThreadPoolExecutor(max_workers=EXTRACTOR_WORKERS, thread_name_prefix='metadata-extractor')
+
+
+class Extractor:
+    """Metadata extractor for one file format.
+
+    ``func(path, header_only)`` returns a JSON serialisable dict. With ``header_only`` it
+    should only read what is needed for a quick preview; an extractor registered with
+    ``header=False`` has no cheaper path, and is only ever run for a full extraction.
+    """
+
+    def __init__(self, name, func, extensions=(), magic=(), header=True):
+        self.name = name
+        self.func = func
+        self.header = header
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.magic = tuple(magic)
+
+
+_extractors = []
+
+
+def register_extractor(name, func, extensions=(), magic=(), header=True):
+    """Register ``func`` for files with one of ``extensions`` or starting with one of ``magic``."""
+    extractor = Extractor(name, func, extensions, magic, header)
+    _extractors.insert(0, extractor)  # Later registrations take precedence
+    return extractor
+
+
+def find_extractor(path):
+    ext = os.path.splitext(path)[1].lower()
+    for extractor in _extractors:
+        if ext in extractor.extensions:
+            return extractor
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(MAGIC_BYTES)
+    except OSError:
+        return None
+    for extractor in _extractors:
+        if any(head.startswith(magic) for magic in extractor.magic):
+            return extractor
+    return None
+
+
+def supported_extensions():
+    return sorted({ext for extractor in _extractors for ext in extractor.extensions})
+
+
+def extract_metadata(path, header_only=False):
+    """Extract metadata from ``path`` with the matching extractor, using the shared cache."""
+    stat = os.stat(path)
+    key = (path, stat.st_size, stat.st_mtime_ns, header_only)
+    metadata = metadata_cache.get(key)
+    if metadata is None and header_only:
+        # A full extraction also answers a header only request
+        metadata = metadata_cache.get(key[:3] + (False,))
+    if metadata is None:
+        extractor = find_extractor(path)
+        if extractor is None:
+            raise ValueError(f"No metadata extractor for {os.path.basename(path)}")
+        if header_only and not extractor.header:
+            header_only = False
+            key = key[:3] + (False,)
+        metadata = extractor.func(path, header_only)
+        metadata_cache.set(key, metadata)
+    return metadata
+
+
+def extract_metadata_async(path, header_only=False):
+    """Run :func:`extract_metadata` on the extractor pool and return its future."""
+    return _executor.submit(extract_metadata, path, header_only)
+
+
+# Both read the whole file, so they are registered without a header pass
+def _extract_json(path, header_only):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _extract_ibw(path, header_only):
+    from util import get_metadata
+    return get_metadata(path)
+
+
+def _extract_csv(path, header_only):
+    with open(path, 'r', newline='') as f:
+        reader = csv.reader(f)
+        columns = next(reader, [])
+        metadata = {'columns': columns, 'n_columns': len(columns)}
+        if not header_only:
+            metadata['n_rows'] = sum(1 for _ in reader)
+    return metadata
+
+
+def _extract_hdf5(path, header_only):
+    import h5py
+
+    def attrs(obj):
+        return {key: _to_json(value) for key, value in obj.attrs.items()}
+
+    with h5py.File(path, 'r') as f:
+        metadata = {'attributes': attrs(f), 'members': list(f.keys())}
+        if not header_only:
+            objects = {}
+
+            def visit(name, obj):
+                entry = {'attributes': attrs(obj)}
+                if isinstance(obj, h5py.Dataset):
+                    entry.update(shape=list(obj.shape), dtype=str(obj.dtype))
+                objects[name] = entry
+
+            f.visititems(visit)
+            metadata['objects'] = objects
+    return metadata
+
+
+_TIFF_TAGS = {
+    256: 'ImageWidth', 257: 'ImageLength', 258: 'BitsPerSample', 259: 'Compression',
+    262: 'PhotometricInterpretation', 270: 'ImageDescription', 271: 'Make', 272: 'Model',
+    277: 'SamplesPerPixel', 282: 'XResolution', 283: 'YResolution', 296: 'ResolutionUnit',
+    305: 'Software', 306: 'DateTime', 315: 'Artist',
+}
+# TIFF field type -> (struct format, size in bytes)
+_TIFF_TYPES = {1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('I', 4), 5: ('II', 8), 11: ('f', 4), 12: ('d', 8)}
+
+
+def _extract_tiff(path, header_only):
+    """Read the tags of the first IFD; a full extraction also counts the pages."""
+    with open(path, 'rb') as f:
+        order = '<' if f.read(2) == b'II' else '>'
+        f.read(2)
+        offset, = struct.unpack(order + 'I', f.read(4))
+        f.seek(offset)
+        n_entries, = struct.unpack(order + 'H', f.read(2))
+        entries = [struct.unpack(order + 'HHII', f.read(12)) for _ in range(n_entries)]
+        next_ifd, = struct.unpack(order + 'I', f.read(4))
+        metadata = {}
+        for tag, field_type, count, value in entries:
+            if tag not in _TIFF_TAGS or field_type not in _TIFF_TYPES:
+                continue
+            fmt, size = _TIFF_TYPES[field_type]
+            if size * count <= 4:
+                raw = struct.pack(order + 'I', value)[:size * count]
+            else:
+                f.seek(value)
+                raw = f.read(size * count)
+            if field_type == 2:
+                parsed = raw.rstrip(b'\x00').decode('latin-1')
+            elif field_type == 5:
+                numerator, denominator = struct.unpack(order + 'II', raw[:8])
+                parsed = numerator / denominator if denominator else None
+            else:
+                values = struct.unpack(order + fmt * count, raw)
+                parsed = values[0] if count == 1 else list(values)
+            metadata[_TIFF_TAGS[tag]] = parsed
+        if not header_only:
+            pages = 1
+            while next_ifd:
+                f.seek(next_ifd)
+                n_entries, = struct.unpack(order + 'H', f.read(2))
+                f.seek(next_ifd + 2 + 12 * n_entries)
+                next_ifd, = struct.unpack(order + 'I', f.read(4))
+                pages += 1
+            metadata['pages'] = pages
+    return metadata
+
+
+def _to_json(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8', errors='replace')
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return value
+
+
+register_extractor('tiff', _extract_tiff, ('.tif', '.tiff'), (b'II*\x00', b'MM\x00*'))
+register_extractor('csv', _extract_csv, ('.csv',))
+register_extractor('hdf5', _extract_hdf5, ('.h5', '.hdf5', '.hdf'), (b'\x89HDF\r\n\x1a\n',))
+register_extractor('ibw', _extract_ibw, ('.ibw',), header=False)
+register_extractor('json', _extract_json, ('.json',), header=False)
@@ -1,6 +1,7 @@
 from __future__ import annotations
 import os
 import json
+import threading
 from typing import ClassVar
 import param
 import panel as pn
@@ -13,8 +14,8 @@ from panel.widgets.input import TextInput
 from panel.io import PeriodicCallback
 from panel.util import fullpath
 from fnmatch import fnmatch
-
-pn.extension('material')
+from extractors import find_extractor, extract_metadata_async, supported_extensions
+from profiling import profiled
 
 class FileSelector(CompositeWidget):
     directory = param.String(default=os.getcwd(), doc="The directory to explore.")
@@ -25,7 +26,9 @@ class FileSelector(CompositeWidget):
     refresh_period = param.Integer(default=None, doc="If set to non-None value indicates how frequently to refresh the directory contents in milliseconds.")
     root_directory = param.String(default=None, doc="If set, overrides directory parameter as the root directory beyond which users cannot navigate.")
     value = param.List(default=[], doc="List of selected files.")
+    metadata = param.Dict(default={}, doc="Metadata extracted from the selected file, header only first and then in full.")
     _composite_type: ClassVar[type[Column]] = Column
+    _profiler = None
 
     def __init__(self, directory=None, **params):
         if directory is not None:
@@ -56,6 +59,9 @@ class FileSelector(CompositeWidget):
         )
         self._composite[:] = [self._nav_bar, Divider(margin=0), self._selector]
 
+        self._metadata_lock = threading.Lock()
+        self._metadata_rank = (None, -1)
+
         self._stack = []
         self._cwd = None
         self._position = -1
@@ -77,7 +83,8 @@ class FileSelector(CompositeWidget):
         if self.refresh_period:
             self._periodic.start()
 
-        self._message = pn.pane.Markdown("<h3>Please select a JSON file</h3>", width_policy='max', height_policy='max')
+        extensions = ', '.join(supported_extensions())
+        self._message = pn.pane.Markdown(f"<h3>Please select a supported file ({extensions})</h3>", width_policy='max', height_policy='max')
         self._selected_file_display = pn.pane.Markdown("", width_policy='max', height_policy='max')
         self._output = pn.Column(self._selected_file_display, self._message)
 
@@ -128,6 +135,7 @@ class FileSelector(CompositeWidget):
     def _refresh(self):
         self._update_files(refresh=True)
 
+    @profiled('FileSelector._update_files')
     def _update_files(self, event=None, refresh=False):
         path = fullpath(self._directory.value)
         refresh = refresh or (event and getattr(event, 'obj', None) is self._reload)
@@ -175,6 +183,7 @@ class FileSelector(CompositeWidget):
         self._selector.options = options
         self._selector.value = selected
 
+    @profiled('FileSelector._filter_denylist')
     def _filter_denylist(self, event):
         dirs, files = self._scan_path(self._cwd, self.file_pattern)
         paths = [('📁' if p in dirs else '') + os.path.relpath(p, self._cwd) for p in dirs + files]
@@ -215,6 +224,13 @@ class FileSelector(CompositeWidget):
         self._directory.value = self._stack[self._position]
         self._update_files()
 
+    def go_to(self, path):
+        """Navigate to ``path`` if it is a directory below the root directory."""
+        path = fullpath(path)
+        if os.path.isdir(path) and path.startswith(self._root_directory):
+            self._directory.value = path
+            self._update_files(True)
+
     def _go_up(self, event=None):
         path = self._cwd.split(os.path.sep)
         self._directory.value = os.path.sep.join(path[:-1]) or os.path.sep
@@ -224,21 +240,40 @@ class FileSelector(CompositeWidget):
         if not selected_files:
             self._selected_file_display.object = ""
             self._output[1:] = [self._message]  # Ensures only one item is assigned
+            self.metadata = {}
             return None
 
         selected_file = selected_files[0]
         self._selected_file_display.object = f"**Selected File:** {selected_file}"
 
-        if selected_file.endswith('.json'):
-            with open(selected_file, 'r') as f:
-                json_data = json.load(f)
-            # Update the Column to display the selected file and JSON viewer
+        extractor = find_extractor(selected_file)
+        if extractor is not None:
             self._output[:] = [self._selected_file_display]  # Replace with selected file display
-            return json_data  # Return JSON data for processing in DataFedApp
+            # The cheap header only pass gives a quick preview, the full pass replaces it
+            self._metadata_rank = (selected_file, -1)
+            for rank, header_only in enumerate((True, False) if extractor.header else (False,)):
+                future = extract_metadata_async(selected_file, header_only)
+                future.add_done_callback(lambda f, path=selected_file, rank=rank: self._set_metadata(path, rank, f))
         else:
-            # Show message if the selected file is not a JSON
+            # Show message if no extractor understands the selected file
             self._output[:] = [self._selected_file_display, self._message]  # Replace with message
-            return None
+            self.metadata = {}
+        return None
+
+    def _set_metadata(self, path, rank, future):
+        with self._metadata_lock:
+            current_path, current_rank = self._metadata_rank
+            if current_path != path or self.value[:1] != [path] or rank < current_rank:
+                return  # Selection changed, or the full result already arrived
+            self._metadata_rank = (path, rank)
+        try:
+            metadata = future.result()
+        except json.JSONDecodeError as e:
+            metadata = {"error": f"Invalid JSON file: {e}"}
+        except Exception as e:
+            metadata = {"error": f"Error processing file: {e}"}
+        if metadata != self.metadata:
+            self.metadata = metadata
 
     def _scan_path(self, path, file_pattern):
         paths = [os.path.join(path, p) for p in os.listdir(path)]
@@ -0,0 +1,346 @@
+from __future__ import annotations
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", os.path.join(os.path.expanduser("~"), ".datafed_panel", "jobs.db"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Finished jobs and their steps are deleted this many seconds after they end
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+PURGE_INTERVAL = 3600
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+ORPHANED_ERROR = "The server restarted before the job finished and the job has no owner to resume it; submit it again"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    state TEXT NOT NULL,
+    error TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    worker TEXT,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created);
+CREATE TABLE IF NOT EXISTS steps (
+    job_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    state TEXT NOT NULL,
+    result TEXT,
+    started REAL,
+    finished REAL,
+    PRIMARY KEY (job_id, name)
+);
+"""
+
+
+class JobQueue:
+    """Persistent job queue backed by SQLite and served by worker threads.
+
+    Handlers are registered per job kind and called as ``handler(api, params, step)``.
+    ``step(name, fn)`` runs ``fn`` once and records its (JSON serialisable) result. The
+    ``api`` is the logged-in client of the session that submitted the job and lives only
+    in that process's memory, so a job is only run by the process that holds its client.
+    Jobs left behind by a process that has exited wait until their owner logs in again;
+    :meth:`adopt` then hands them that session's client and they resume after their last
+    completed step.
+    """
+
+    def __init__(self, path=JOB_DB_PATH, workers=JOB_WORKERS):
+        self.path = path
+        self.workers = workers
+        self._handlers = {}
+        self._apis = {}
+        self._callbacks = {}
+        self._threads = []
+        self._pid = None
+        self._purged = 0.0
+        self._claim_lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._stopped = threading.Event()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column in ('worker', 'owner'):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} TEXT")
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and is closed when the block ends."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind, handler):
+        self._handlers[kind] = handler
+
+    def start(self):
+        if self._threads and self._pid == os.getpid():
+            return
+        # Worker threads do not survive a fork, so a forked server process starts its own
+        self._threads = []
+        self._pid = os.getpid()
+        # Jobs of a process that has exited lost their session with it: they are queued
+        # again for their owner's next login. Those of sibling processes serving the same
+        # database are left alone
+        with self._connect() as conn:
+            orphans = [row for row in conn.execute(
+                "SELECT id, state, worker, owner FROM jobs WHERE state IN (?, ?)", (QUEUED, RUNNING)
+            ).fetchall() if self._orphaned(row)]
+            conn.executemany(
+                "UPDATE jobs SET state=?, worker=NULL WHERE id=? AND state=?",
+                [(QUEUED, row['id'], row['state']) for row in orphans if row['owner']]
+            )
+            conn.executemany(
+                "UPDATE jobs SET state=?, error=?, finished=? WHERE id=? AND state=?",
+                [(FAILED, ORPHANED_ERROR, time.time(), row['id'], row['state']) for row in orphans if not row['owner']]
+            )
+        self.purge()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"datafed-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def submit(self, kind, params, api=None, on_done=None):
+        """Queue a job and return its ID.
+
+        ``api`` and ``on_done`` are kept in memory only; ``on_done(job)`` is called from a
+        worker thread. The job is owned by the user ``api`` is logged in as. A job without
+        an ``api`` fails when it is run.
+        """
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind '{kind}'")
+        job_id = uuid.uuid4().hex[:12]
+        if api is not None:
+            self._apis[job_id] = api
+        if on_done is not None:
+            self._callbacks[job_id] = on_done
+        owner = api.getAuthUser() if api is not None else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, state, created, worker, owner) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), QUEUED, time.time(), _worker_id(), owner and str(owner))
+            )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def adopt(self, api):
+        """Resume the interrupted jobs of the user ``api`` is logged in as, using ``api``.
+
+        Steps a job completed before the interruption are not run again. Returns the IDs
+        of the adopted jobs.
+        """
+        owner = api.getAuthUser()
+        if not owner:
+            return []
+        with self._connect() as conn:
+            orphans = [row for row in conn.execute(
+                "SELECT id, state, worker FROM jobs WHERE owner=? AND state IN (?, ?)", (str(owner), QUEUED, RUNNING)
+            ).fetchall() if self._orphaned(row)]
+        adopted = []
+        for row in orphans:
+            # The client is in place before the job becomes claimable
+            self._apis[row['id']] = api
+            with self._connect() as conn:
+                claimed = conn.execute(
+                    "UPDATE jobs SET state=?, worker=? WHERE id=? AND state=? AND worker IS ?",
+                    (QUEUED, _worker_id(), row['id'], row['state'], row['worker'])
+                ).rowcount
+            if claimed:
+                adopted.append(row['id'])
+            else:
+                self._apis.pop(row['id'], None)
+        if adopted:
+            with self._wakeup:
+                self._wakeup.notify_all()
+        return adopted
+
+    def purge(self, retention=JOB_RETENTION):
+        """Delete jobs that finished more than ``retention`` seconds ago, with their steps."""
+        self._purged = time.time()
+        cutoff = self._purged - retention
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM steps WHERE job_id IN (SELECT id FROM jobs WHERE state IN (?, ?) AND finished < ?)",
+                (DONE, FAILED, cutoff)
+            )
+            conn.execute("DELETE FROM jobs WHERE state IN (?, ?) AND finished < ?", (DONE, FAILED, cutoff))
+
+    def _orphaned(self, row):
+        """Whether an unfinished job's process has exited, taking its client with it."""
+        return row['id'] not in self._apis and not _worker_alive(row['worker'])
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+        return _job_dict(row) if row else None
+
+    def steps(self, job_id):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM steps WHERE job_id=? ORDER BY started", (job_id,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self):
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        with self._connect() as conn:
+            for state, count in conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+                counts[state] = count
+        return counts
+
+    def recent(self, limit=20):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [_job_dict(row) for row in rows]
+
+    def _claim(self):
+        # Only jobs queued or adopted by this process, which holds their API; the conditional UPDATE
+        # makes the claim atomic across the worker threads
+        with self._claim_lock, self._connect() as conn:
+            while True:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE state=? AND worker=? ORDER BY created LIMIT 1", (QUEUED, _worker_id())
+                ).fetchone()
+                if row is None:
+                    return None
+                claimed = conn.execute(
+                    "UPDATE jobs SET state=?, started=COALESCE(started, ?), worker=? WHERE id=? AND state=?",
+                    (RUNNING, time.time(), _worker_id(), row['id'], QUEUED)
+                ).rowcount
+                if claimed:
+                    return _job_dict(row)
+
+    def _work(self):
+        while not self._stopped.is_set():
+            job = self._claim()
+            if job is None:
+                if time.time() - self._purged > PURGE_INTERVAL:
+                    self.purge()
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job['id']
+        state, error = DONE, None
+        try:
+            handler = self._handlers[job['kind']]
+            api = self._apis.get(job_id)
+            if api is None:
+                raise RuntimeError("No logged-in DataFed session for this job")
+            handler(api, job['params'], self._step_runner(job_id))
+        except Exception as e:
+            state, error = FAILED, str(e)
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET state=?, error=?, finished=? WHERE id=?",
+                (state, error, time.time(), job_id)
+            )
+        self._apis.pop(job_id, None)
+        callback = self._callbacks.pop(job_id, None)
+        if callback is not None:
+            try:
+                callback(self.get(job_id))
+            except Exception:
+                pass
+
+    def _step_runner(self, job_id):
+        def step(name, fn):
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT state, result FROM steps WHERE job_id=? AND name=?", (job_id, name)
+                ).fetchone()
+                if row is not None and row['state'] == DONE:
+                    return json.loads(row['result'])
+                conn.execute(
+                    "INSERT OR REPLACE INTO steps (job_id, name, state, started) VALUES (?, ?, ?, ?)",
+                    (job_id, name, RUNNING, time.time())
+                )
+            try:
+                result = fn()
+            except Exception as e:
+                with self._connect() as conn:
+                    conn.execute(
+                        "UPDATE steps SET state=?, result=?, finished=? WHERE job_id=? AND name=?",
+                        (FAILED, json.dumps(str(e)), time.time(), job_id, name)
+                    )
+                raise
+            with self._connect() as conn:
+                conn.execute(
+                    "UPDATE steps SET state=?, result=?, finished=? WHERE job_id=? AND name=?",
+                    (DONE, json.dumps(result), time.time(), job_id, name)
+                )
+            return result
+        return step
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _worker_alive(worker):
+    """Whether the process that claimed a job (``host:pid``) is still running on this host."""
+    host, _, pid = (worker or '').rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _job_dict(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    now = time.time()
+    job['wait_time'] = (job['started'] or now) - job['created']
+    job['run_time'] = ((job['finished'] or now) - job['started']) if job['started'] else None
+    return job
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue shared by all sessions."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+        return _job_queue
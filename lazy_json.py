@@ -0,0 +1,218 @@
+from __future__ import annotations
+import os
+from difflib import SequenceMatcher
+import param
+import panel as pn
+from panel.viewable import Viewer
+
+LAZY_JSON_COLLAPSE_SIZE = int(os.getenv("LAZY_JSON_COLLAPSE_SIZE", "200"))
+
+
+class PlaceholderEdit(ValueError):
+    """Raised when a browser edit would write a collapsed subtree's placeholder into the document."""
+
+
+def _placeholder(node):
+    kind = 'keys' if isinstance(node, dict) else 'items'
+    return f"▸ {len(node)} {kind} (expand to load)"
+
+
+def _size(node, limit):
+    """Number of values in ``node``, counted only up to ``limit``."""
+    count = 1
+    if isinstance(node, (dict, list)):
+        for item in node.values() if isinstance(node, dict) else node:
+            count += _size(item, limit - count)
+            if count >= limit:
+                break
+    return count
+
+
+def _contains(value, strings):
+    if isinstance(value, str):
+        return value in strings
+    if isinstance(value, dict):
+        return any(_contains(item, strings) for item in value.values())
+    if isinstance(value, list):
+        return any(_contains(item, strings) for item in value)
+    return False
+
+
+def _path_label(path):
+    return '/'.join(str(p) for p in path)
+
+
+def _set_in(doc, path, value, op='replace'):
+    """Return ``doc`` with ``op`` applied at ``path``, copying only the containers on the path.
+
+    As in JSON Patch, ``add`` inserts into a list and ``replace`` overwrites an item.
+    """
+    if not path:
+        return value
+    head, rest = path[0], path[1:]
+    copy = dict(doc) if isinstance(doc, dict) else list(doc)
+    if rest:
+        copy[head] = _set_in(doc[head], rest, value, op)
+    elif op == 'remove':
+        del copy[head]
+    elif op == 'add' and isinstance(copy, list):
+        copy.insert(head, value)
+    else:
+        copy[head] = value
+    return copy
+
+
+def apply_patches(doc, patches):
+    """Apply ``[{'op', 'path', 'value'}, ...]`` patches (JSON Patch add/remove/replace) to ``doc``, in order."""
+    for patch in patches:
+        doc = _set_in(doc, tuple(patch['path']), patch.get('value'), patch['op'])
+    return doc
+
+
+class LazyJSONEditor(Viewer):
+    """JSON editor that keeps the full document on the server.
+
+    The first ``depth`` levels are always sent to the browser; deeper containers with
+    more than ``collapse_size`` values are shown as placeholders and their subtree is sent
+    when the path is expanded. Browser edits are turned into patches against the collapsed
+    view and applied to the full document; an edit that changes or copies a placeholder is
+    rejected, since its subtree was never sent. Items may be added to or removed from lists
+    that hold placeholders.
+
+    Panel's ``JSONEditor`` only syncs its whole value, so the browser sends the collapsed
+    view back on every edit and the patches are computed here, and expanding a subtree
+    sends the view again. Only the collapsed subtrees stay out of the browser.
+    """
+
+    value = param.Parameter(default={}, doc="The full JSON document.")
+    patches = param.List(default=[], doc="Patches produced by the most recent edit in the browser.")
+    depth = param.Integer(default=3, bounds=(1, None), doc="Levels shown before large containers are collapsed.")
+    collapse_size = param.Integer(
+        default=LAZY_JSON_COLLAPSE_SIZE, bounds=(1, None), doc="Values a container must exceed to be collapsed."
+    )
+    readonly = param.Boolean(default=False, doc="Whether the document can be edited.")
+    width = param.Integer(default=600)
+    height = param.Integer(default=None, allow_None=True)
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self._expanded = set()
+        self._collapsed = {}
+        self._sent = {}
+        self._internal = False
+        self._editor = pn.widgets.JSONEditor(
+            mode='view' if self.readonly else 'tree', width=self.width, height=self.height
+        )
+        self._paths = pn.widgets.Select(name='Collapsed subtree', options={}, width=self.width - 180)
+        self._expand = pn.widgets.Button(name='Expand', width=80, align='end')
+        self._expand.on_click(self._expand_path)
+        self._collapse_all = pn.widgets.Button(name='Collapse all', width=90, align='end')
+        self._collapse_all.on_click(self._reset_view)
+        self._controls = pn.Row(self._paths, self._expand, self._collapse_all, visible=False)
+        self._message = pn.pane.Markdown("", margin=0)
+        self._layout = pn.Column(self._controls, self._message, self._editor, name=self.name)
+        self._editor.param.watch(self._on_edit, 'value')
+        self.param.watch(self._on_value, 'value')
+        self._render()
+
+    def __panel__(self):
+        return self._layout
+
+    def _on_value(self, event):
+        if not self._internal:
+            self._reset_view()
+
+    def _reset_view(self, event=None):
+        self._expanded.clear()
+        self._render()
+
+    def _expand_path(self, event=None):
+        if self._paths.value is not None:
+            self._expanded.add(self._paths.value)
+            self._render()
+
+    def _collapse(self, node, path, level):
+        if isinstance(node, (dict, list)) and node:
+            if (
+                path and level >= self.depth and path not in self._expanded
+                and _size(node, self.collapse_size + 1) > self.collapse_size
+            ):
+                self._collapsed[path] = _placeholder(node)
+                return self._collapsed[path]
+            if isinstance(node, dict):
+                return {key: self._collapse(item, path + (key,), level + 1) for key, item in node.items()}
+            return [self._collapse(item, path + (i,), level + 1) for i, item in enumerate(node)]
+        return node
+
+    def _render(self):
+        self._collapsed = {}
+        self._sent = self._collapse(self.value, (), 0)
+        self._paths.options = {_path_label(path): path for path in self._collapsed}
+        self._controls.visible = bool(self._collapsed)
+        self._internal = True
+        try:
+            self._editor.value = self._sent
+        finally:
+            self._internal = False
+
+    def _diff(self, old, new, path, patches):
+        if path in self._collapsed and old == self._collapsed[path]:
+            if new != old:
+                raise PlaceholderEdit(f"{_path_label(path)} is collapsed; expand it before editing")
+            return
+        if isinstance(old, dict) and isinstance(new, dict):
+            for key in old.keys() - new.keys():
+                patches.append({'op': 'remove', 'path': list(path + (key,))})
+            for key, item in new.items():
+                if key not in old:
+                    patches.append({'op': 'add', 'path': list(path + (key,)), 'value': item})
+                else:
+                    self._diff(old[key], item, path + (key,), patches)
+        elif isinstance(old, list) and isinstance(new, list):
+            # Unchanged items are aligned first, so adding or removing items leaves the
+            # collapsed items around them alone. Patches apply in order, so ``shift`` tracks
+            # how far the list has moved from the old indexes
+            matcher = SequenceMatcher(None, [repr(item) for item in old], [repr(item) for item in new], autojunk=False)
+            shift = 0
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag == 'equal':
+                    continue
+                paired = min(i2 - i1, j2 - j1)
+                for k in range(paired):
+                    self._diff(old[i1 + k], new[j1 + k], path + (i1 + shift + k,), patches)
+                for _ in range(i2 - i1 - paired):
+                    patches.append({'op': 'remove', 'path': list(path + (i1 + shift + paired,))})
+                for k in range(paired, j2 - j1):
+                    patches.append({'op': 'add', 'path': list(path + (i1 + shift + k,)), 'value': new[j1 + k]})
+                shift += (j2 - j1) - (i2 - i1)
+        elif old != new:
+            patches.append({'op': 'replace', 'path': list(path), 'value': new})
+
+    def _on_edit(self, event):
+        if self._internal:
+            return
+        patches = []
+        try:
+            self._diff(self._sent, event.new, (), patches)
+            placeholders = set(self._collapsed.values())
+            for patch in patches:
+                if 'value' in patch and _contains(patch['value'], placeholders):
+                    # e.g. a renamed or moved key whose value is a placeholder
+                    raise PlaceholderEdit(f"{_path_label(patch['path'])} holds a collapsed subtree; expand it first")
+        except PlaceholderEdit as e:
+            self._message.object = f"Warning: {e}"
+            self._render()
+            return
+        self._message.object = ""
+        self._sent = event.new
+        if not patches:
+            return
+        self._internal = True
+        try:
+            self.patches = patches
+            self.value = apply_patches(self.value, patches)
+        finally:
+            self._internal = False
+        if any(patch['op'] != 'replace' and isinstance(patch['path'][-1], int) for patch in patches):
+            # List items moved, so the placeholders are re-numbered from the new document
+            self._render()
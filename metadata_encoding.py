@@ -0,0 +1,88 @@
+from __future__ import annotations
+import json
+import math
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+def decode_bytes(value, codec='utf-8'):
+    """Decode bytes as text, falling back to Latin-1 like older AR software notes."""
+    try:
+        return value.decode(codec)
+    except UnicodeDecodeError:
+        return value.decode('ISO-8859-1')
+
+
+def _default(obj):
+    """Convert the values JSON cannot represent natively: NumPy scalars and arrays, and bytes."""
+    import numpy as np
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    if isinstance(obj, np.bool_):
+        return bool(obj)
+    if isinstance(obj, bytes):
+        return decode_bytes(obj)
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_metadata(metadata):
+    """Encode ``metadata`` as compact JSON.
+
+    orjson is used when it is installed, otherwise the standard library with compact
+    separators; both give the same result: NaN and infinities become ``null``, non-string
+    keys are converted to strings and integers of any size are written exactly.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(metadata, default=_default, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        except orjson.JSONEncodeError:
+            pass  # e.g. an integer wider than 64 bits; the standard library handles it
+    try:
+        return json.dumps(metadata, default=_default, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+    except ValueError:
+        return json.dumps(_finite(metadata, _default), separators=(',', ':'), ensure_ascii=False)
+
+
+def _finite(value, default):
+    """Copy of ``value`` with NaN and infinities replaced by None, as orjson writes them."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: _finite(item, default) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_finite(item, default) for item in value]
+    if value is None or isinstance(value, (str, int)):
+        return value
+    return _finite(default(value), default)
+
+
+def payload_report(payload, top=5):
+    """Summarise the encoded size of a JSON object payload and its largest top level keys."""
+    size = len(payload.encode('utf-8'))
+    largest = []
+    value = json.loads(payload)
+    if isinstance(value, dict):
+        sizes = {key: len(json.dumps(item, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+                 for key, item in value.items()}
+        largest = sorted(sizes.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return {'bytes': size, 'largest_keys': largest}
+
+
+def format_report(report):
+    keys = ', '.join(f"{key} ({_human(size)})" for key, size in report['largest_keys'])
+    text = f"Metadata payload: {_human(report['bytes'])}"
+    return f"{text}; largest keys: {keys}" if keys else text
+
+
+def _human(n_bytes):
+    for unit in ('B', 'KB', 'MB'):
+        if n_bytes < 1024 or unit == 'MB':
+            return f"{n_bytes:.0f} {unit}" if unit == 'B' else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
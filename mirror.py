@@ -0,0 +1,365 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from client_pool import map_clients
+from record_compare import decode_record
+
+MIRROR_DB_PATH = os.getenv("MIRROR_DB_PATH", os.path.join(os.path.expanduser("~"), ".datafed_panel", "mirror.db"))
+MIRROR_SYNC_INTERVAL = float(os.getenv("MIRROR_SYNC_INTERVAL", "60"))
+MIRROR_PAGE_SIZE = 500
+MIRROR_MAX_OFFSET = 5000
+# Deletions are not visible to an incremental sync; every Nth sync compares the full ID list
+MIRROR_RECONCILE_EVERY = int(os.getenv("MIRROR_RECONCILE_EVERY", "10"))
+
+MIRROR_COLUMNS = ['id', 'title', 'alias', 'owner', 'ut']
+SORT_COLUMNS = {'id', 'title', 'alias', 'owner', 'ct', 'ut'}
+OPERATORS = {'=': '=', '==': '=', '!=': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>=', '~': 'LIKE'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user TEXT NOT NULL,
+    context TEXT NOT NULL,
+    cursor INTEGER NOT NULL DEFAULT 0,
+    syncs INTEGER NOT NULL DEFAULT 0,
+    synced REAL,
+    error TEXT,
+    PRIMARY KEY (user, context)
+);
+CREATE TABLE IF NOT EXISTS records (
+    user TEXT NOT NULL,
+    context TEXT NOT NULL,
+    id TEXT NOT NULL,
+    title TEXT,
+    alias TEXT,
+    owner TEXT,
+    parent_id TEXT,
+    tags TEXT,
+    metadata TEXT,
+    ct INTEGER,
+    ut INTEGER,
+    PRIMARY KEY (user, context, id)
+);
+CREATE INDEX IF NOT EXISTS records_ut ON records (user, context, ut);
+CREATE INDEX IF NOT EXISTS records_title ON records (user, context, title);
+CREATE INDEX IF NOT EXISTS records_parent ON records (user, context, parent_id);
+"""
+
+_NUMBER = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+_FILTER = re.compile(r'^\s*(?P<key>[^<>=!~]+?)\s*(?P<op>==|!=|<=|>=|=|<|>|~)\s*(?P<value>.*?)\s*$')
+
+
+def json_path(key):
+    """SQLite JSON path of a dotted metadata key; DataFed's ``md.`` prefix is optional."""
+    parts = key.strip().split('.')
+    if parts[0] == 'md' and len(parts) > 1:
+        parts = parts[1:]
+    if any(not part or '"' in part or "'" in part for part in parts):
+        raise ValueError(f"Invalid metadata key '{key}'")
+    return '$' + ''.join(f'."{part}"' for part in parts)
+
+
+def _metadata_expr(key):
+    # Inlined rather than bound so that the expression indexes below can be used
+    return f"json_extract(metadata, '{json_path(key)}')"
+
+
+def parse_filter(expression):
+    """Parse ``"key op value"`` conditions joined by ``and`` or commas into ``[(key, op, value)]``.
+
+    Operators are ``= != < <= > >=`` and ``~`` (substring match); numeric values are
+    compared as numbers.
+    """
+    filters = []
+    for condition in re.split(r'\s+and\s+|,', expression or '', flags=re.IGNORECASE):
+        if not condition.strip():
+            continue
+        match = _FILTER.match(condition)
+        if match is None:
+            raise ValueError(f"Cannot parse filter '{condition.strip()}', expected 'key op value'")
+        value = match['value'].strip('\'"')
+        if _NUMBER.fullmatch(value):
+            value = float(value)
+        filters.append((match['key'], match['op'], value))
+    return filters
+
+
+class Mirror:
+    """Local SQLite copy of the records of subscribed (user, context) pairs.
+
+    Metadata is stored as JSON and filtered with SQLite's JSON1 functions; an expression
+    index is created the first time a metadata key is filtered or sorted on.
+    """
+
+    def __init__(self, path=MIRROR_DB_PATH):
+        self.path = path
+        self._indexed = set()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and is closed when the block ends."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def subscribe(self, user, context):
+        with self._connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO subscriptions (user, context) VALUES (?, ?)", (user, context))
+
+    def unsubscribe(self, user, context):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM subscriptions WHERE user=? AND context=?", (user, context))
+            conn.execute("DELETE FROM records WHERE user=? AND context=?", (user, context))
+
+    def subscriptions(self, user=None):
+        with self._connect() as conn:
+            if user is None:
+                rows = conn.execute("SELECT * FROM subscriptions").fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM subscriptions WHERE user=?", (user,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def status(self, user, context):
+        """Subscription state with its record count, or None when ``context`` is not mirrored."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM subscriptions WHERE user=? AND context=?", (user, context)).fetchone()
+            if row is None:
+                return None
+            count = conn.execute("SELECT COUNT(*) FROM records WHERE user=? AND context=?", (user, context)).fetchone()[0]
+        return dict(row, records=count)
+
+    def upsert(self, user, context, records):
+        rows = [
+            (
+                user, context, record['id'], record.get('title'), record.get('alias'), record.get('owner'),
+                record.get('parentId'), json.dumps(record.get('tags', [])),
+                json.dumps(record['metadata']) if 'metadata' in record else None,
+                int(record.get('ct', 0)), int(record.get('ut', 0)),
+            )
+            for record in records
+        ]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def remove(self, user, context, record_ids):
+        with self._connect() as conn:
+            conn.executemany(
+                "DELETE FROM records WHERE user=? AND context=? AND id=?",
+                [(user, context, record_id) for record_id in record_ids]
+            )
+
+    def record_ids(self, user, context, ut=None):
+        """IDs of the mirrored records, or only of those last updated at ``ut``."""
+        sql, args = "SELECT id FROM records WHERE user=? AND context=?", [user, context]
+        if ut is not None:
+            sql, args = sql + " AND ut=?", args + [ut]
+        with self._connect() as conn:
+            return {row[0] for row in conn.execute(sql, args)}
+
+    def ensure_index(self, key):
+        expr = _metadata_expr(key)
+        with self._lock:
+            if expr in self._indexed:
+                return
+            name = 'records_md_' + hashlib.sha1(expr.encode('utf-8')).hexdigest()[:12]
+            with self._connect() as conn:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON records (user, context, {expr})')
+            self._indexed.add(expr)
+
+    def query(self, user, context, coll_id=None, text=None, tags=None, filters=(), sort='title', limit=None, offset=0):
+        """Return matching records as ``MIRROR_COLUMNS`` dicts.
+
+        ``filters`` are ``(metadata key, operator, value)`` tuples as returned by
+        :func:`parse_filter`. ``sort`` is a record column or a metadata key, prefixed
+        with ``-`` for descending order.
+        """
+        clauses, args = ["user=?", "context=?"], [user, context]
+        if coll_id:
+            clauses.append("parent_id=?")
+            args.append(coll_id)
+        if text:
+            clauses.append("(title LIKE ? OR alias LIKE ?)")
+            args += [f"%{text}%"] * 2
+        for tag in tags or []:
+            clauses.append("EXISTS (SELECT 1 FROM json_each(records.tags) WHERE value=?)")
+            args.append(tag)
+        for key, op, value in filters:
+            self.ensure_index(key)
+            if op == '~':
+                value = f"%{value}%"
+            clauses.append(f"{_metadata_expr(key)} {OPERATORS[op]} ?")
+            args.append(value)
+
+        descending = (sort or '').startswith('-')
+        sort = (sort or 'title').lstrip('-')
+        if sort in SORT_COLUMNS:
+            order = sort
+        else:
+            self.ensure_index(sort)
+            order = _metadata_expr(sort)
+        sql = (
+            f"SELECT {', '.join(MIRROR_COLUMNS)} FROM records WHERE {' AND '.join(clauses)} "
+            f"ORDER BY {order} {'DESC' if descending else 'ASC'}, id LIMIT ? OFFSET ?"
+        )
+        with self._connect() as conn:
+            rows = conn.execute(sql, args + [-1 if limit is None else limit, offset]).fetchall()
+        return [dict(row) for row in rows]
+
+    def _set_state(self, user, context, **fields):
+        assignments = ', '.join(f"{name}=?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE subscriptions SET {assignments} WHERE user=? AND context=?",
+                list(fields.values()) + [user, context]
+            )
+
+
+def _view(api, record_id, context):
+    return decode_record(api.dataView(data_id=record_id, context=context)[0])['data'][0]
+
+
+def _fetch(api, record_ids, context):
+    """``dataView`` ``record_ids`` in parallel over the session's client pool, bypassing the record cache."""
+    return map_clients(api, lambda client, record_id: _view(client, record_id, context), record_ids)
+
+
+def _pages(api, context, **query):
+    """Yield the ``queryDirect`` listing pages of ``context``, stopping at the server's paging limit."""
+    for offset in range(0, MIRROR_MAX_OFFSET, MIRROR_PAGE_SIZE):
+        items = api.queryDirect(owner=context, offset=offset, count=MIRROR_PAGE_SIZE, **query)[0].item
+        yield items
+        if len(items) < MIRROR_PAGE_SIZE:
+            return
+
+
+def sync_context(mirror, api, user, context):
+    """Fetch the records of ``context`` modified since the last sync; returns how many were updated.
+
+    The cursor is the newest update time mirrored, paired with the IDs mirrored at that
+    time. Update times are whole seconds and ``queryDirect`` time bounds are inclusive, so
+    the cursor's own second is listed on its own and only records not mirrored at that
+    time are fetched. The rest are listed by update time from the next second on. An
+    unchanged context costs two listing queries and no ``dataView``. When the listing
+    reaches the server's paging limit it continues from the newest update time seen.
+    """
+    state = mirror.status(user, context)
+    cursor, updated = state['cursor'], 0
+    while True:
+        if cursor:
+            known = mirror.record_ids(user, context, ut=cursor)
+            for items in _pages(api, context, time_from=str(cursor), time_to=str(cursor), sort='id'):
+                records = _fetch(api, [item.id for item in items if item.id not in known], context)
+                if records:
+                    mirror.upsert(user, context, records)
+                    updated += len(records)
+        latest, complete = cursor, False
+        for items in _pages(api, context, time_from=str(cursor + 1) if cursor else None, sort='ut'):
+            records = _fetch(api, [item.id for item in items], context)
+            if records:
+                mirror.upsert(user, context, records)
+                updated += len(records)
+                latest = max([latest] + [int(record.get('ut', 0)) for record in records])
+            complete = len(items) < MIRROR_PAGE_SIZE
+        if complete or latest == cursor:
+            break
+        cursor = latest
+    mirror._set_state(user, context, cursor=latest, syncs=state['syncs'] + 1, synced=time.time(), error=None)
+    return updated
+
+
+def reconcile_context(mirror, api, user, context):
+    """Drop mirrored records that no longer exist in DataFed; returns how many were removed."""
+    live, offset = set(), 0
+    while True:
+        items = api.queryDirect(owner=context, sort='id', offset=offset, count=MIRROR_PAGE_SIZE)[0].item
+        live.update(item.id for item in items)
+        if len(items) < MIRROR_PAGE_SIZE:
+            break
+        offset += MIRROR_PAGE_SIZE
+    gone = mirror.record_ids(user, context) - live
+    mirror.remove(user, context, gone)
+    return len(gone)
+
+
+class MirrorSyncer:
+    """Background thread that keeps the subscriptions of users with a live session in sync.
+
+    Syncing uses the API of the user's session, so the mirror only ever holds what that
+    user is allowed to see.
+    """
+
+    def __init__(self, mirror, interval=MIRROR_SYNC_INTERVAL):
+        self.mirror = mirror
+        self.interval = interval
+        self._sessions = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def attach(self, session, user, api):
+        """Sync the subscriptions of ``user`` with ``api`` while ``session`` is attached."""
+        self._sessions[session] = (user, api)
+        self.start()
+        self.sync_now()
+
+    def detach(self, session):
+        self._sessions.pop(session, None)
+
+    def _api(self, user):
+        """The API of any attached session of ``user``."""
+        for session_user, api in list(self._sessions.values()):
+            if session_user == user:
+                return api
+        return None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='datafed-mirror-sync', daemon=True)
+            self._thread.start()
+
+    def sync_now(self):
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            for subscription in self.mirror.subscriptions():
+                user, context = subscription['user'], subscription['context']
+                api = self._api(user)
+                if api is None:
+                    continue
+                try:
+                    sync_context(self.mirror, api, user, context)
+                    if subscription['syncs'] % MIRROR_RECONCILE_EVERY == MIRROR_RECONCILE_EVERY - 1:
+                        reconcile_context(self.mirror, api, user, context)
+                except Exception as e:
+                    self.mirror._set_state(user, context, error=str(e))
+
+
+_syncer = None
+_syncer_lock = threading.Lock()
+
+
+def get_syncer():
+    """Return the process-wide mirror syncer (and its mirror)."""
+    global _syncer
+    with _syncer_lock:
+        if _syncer is None:
+            _syncer = MirrorSyncer(Mirror())
+        return _syncer
@@ -0,0 +1,21 @@
+"""Warm up a server process: ``panel serve app.py --setup preload.py``.
+
+Panel runs this once in each server process before it serves sessions (after the fork
+with ``--num-procs``), so the first session of every process does not pay for importing
+Panel, pandas and the DataFed client. The job workers start here too; jobs interrupted by
+a restart resume once their owner logs in again.
+"""
+import os
+import sys
+
+# Panel adds the app's directory to the import path only while running the app itself
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from startup import configure  # noqa: E402
+
+configure()
+
+import datafed_app  # noqa: E402,F401
+from datafed_service import job_queue  # noqa: E402
+
+job_queue.start()
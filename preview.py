@@ -0,0 +1,166 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+THUMBNAIL_CACHE_DIR = os.getenv("THUMBNAIL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".datafed_panel", "thumbnails"))
+THUMBNAIL_CACHE_BYTES = int(os.getenv("THUMBNAIL_CACHE_BYTES", str(256 * 1024 * 1024)))
+THUMBNAIL_SIZE = 128
+PREVIEW_WORKERS = int(os.getenv("PREVIEW_WORKERS", "2"))
+
+# Igor binary wave version 5 layout: BinHeader5 then WaveHeader5, then the wave data
+_BIN_HEADER_SIZE = 64
+_WAVE_HEADER_SIZE = 320
+_MAX_DIM_LABEL_CHARS = 32
+# Igor number type -> NumPy dtype character
+_IGOR_TYPES = {2: 'f4', 4: 'f8', 8: 'i1', 0x10: 'i2', 0x20: 'i4', 0x48: 'u1', 0x50: 'u2', 0x60: 'u4', 3: 'c8', 5: 'c16'}
+
+_executor = None
+
+
+def _ibw_layout(path):
+    """Return byte order, dtype, dimensions and section sizes of a version 5 IBW file."""
+    with open(path, 'rb') as f:
+        bin_header = f.read(_BIN_HEADER_SIZE)
+        wave_header = f.read(_WAVE_HEADER_SIZE)
+    order = '<'
+    version, = struct.unpack('<h', bin_header[:2])
+    if version != 5:
+        order = '>'
+        version, = struct.unpack('>h', bin_header[:2])
+    if version != 5:
+        raise ValueError(f"Unsupported IBW version {version}, only version 5 can be memory mapped")
+    wfm_size, formula_size, note_size, data_units_size = struct.unpack(order + '4i', bin_header[4:20])
+    dim_units_sizes = struct.unpack(order + '4i', bin_header[20:36])
+    dim_labels_sizes = struct.unpack(order + '4i', bin_header[36:52])
+    wave_type, = struct.unpack(order + 'h', wave_header[16:18])
+    dims = [n for n in struct.unpack(order + '4i', wave_header[68:84]) if n > 0]
+    if wave_type not in _IGOR_TYPES:
+        raise ValueError(f"Unsupported Igor number type {wave_type}")
+    labels_offset = (_BIN_HEADER_SIZE + wfm_size + formula_size + note_size
+                     + data_units_size + sum(dim_units_sizes))
+    return {
+        'order': order,
+        'dtype': order + _IGOR_TYPES[wave_type],
+        'shape': tuple(dims) or (1,),
+        'labels_offset': labels_offset,
+        'dim_labels_sizes': dim_labels_sizes,
+    }
+
+
+def _read_channel_labels(path, layout):
+    """Read the layer (channel) labels, skipping the label of the dimension itself."""
+    sizes = layout['dim_labels_sizes']
+    with open(path, 'rb') as f:
+        f.seek(layout['labels_offset'] + sizes[0] + sizes[1])
+        raw = f.read(sizes[2])
+    labels = [
+        raw[i:i + _MAX_DIM_LABEL_CHARS].split(b'\x00', 1)[0]
+        for i in range(0, len(raw), _MAX_DIM_LABEL_CHARS)
+    ]
+    return [label for label in labels[1:] if label]
+
+
+def _png(image):
+    """Encode a 2D ``uint8`` array as a grayscale PNG."""
+    height, width = image.shape
+    rows = b''.join(b'\x00' + image[row].tobytes() for row in range(height))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b'')
+
+
+def _thumbnail(plane, size):
+    import numpy as np
+    step = max(1, -(-max(plane.shape) // size))
+    small = np.asarray(plane[::step, ::step])
+    if np.iscomplexobj(small):
+        small = np.abs(small)
+    small = small.astype(np.float64)
+    finite = np.isfinite(small)
+    if not finite.any():
+        return np.zeros(small.shape, dtype=np.uint8)
+    low, high = np.percentile(small[finite], (1, 99))
+    scaled = (np.clip(small, low, high) - low) / ((high - low) or 1)
+    scaled[~finite] = 0
+    # Igor stores images column-major with the origin at the bottom left
+    return (scaled * 255).astype(np.uint8).T[::-1]
+
+
+def _cache_key(path, size):
+    stat = os.stat(path)
+    return hashlib.sha1(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}:{size}".encode()).hexdigest()
+
+
+def _evict(cache_dir, budget):
+    entries = []
+    for name in os.listdir(cache_dir):
+        full = os.path.join(cache_dir, name)
+        stat = os.stat(full)
+        entries.append((stat.st_mtime, stat.st_size, full))
+    total = sum(size for _, size, _ in entries)
+    for _, size, full in sorted(entries):
+        if total <= budget:
+            break
+        os.remove(full)
+        total -= size
+
+
+def generate_previews(path, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_CACHE_DIR, budget=THUMBNAIL_CACHE_BYTES):
+    """Return ``[{'label', 'unit', 'png'}, ...]`` with one downsampled thumbnail per channel.
+
+    The wave data is memory mapped, so only the sampled rows are read from disk.
+    Thumbnails are kept in a size bounded on-disk cache evicted least recently used first.
+    """
+    import numpy as np
+    from util import _get_chan_labels
+
+    os.makedirs(cache_dir, exist_ok=True)
+    key = _cache_key(path, size)
+    index_path = os.path.join(cache_dir, f"{key}.json")
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            previews = json.load(f)
+        if all(os.path.exists(p['png']) for p in previews):
+            for p in previews:
+                os.utime(p['png'])
+            os.utime(index_path)
+            return previews
+
+    layout = _ibw_layout(path)
+    data = np.memmap(path, dtype=np.dtype(layout['dtype']), mode='r',
+                     offset=_BIN_HEADER_SIZE + _WAVE_HEADER_SIZE, shape=layout['shape'], order='F')
+    if data.ndim == 1:
+        data = data.reshape(-1, 1)
+    n_chans = data.shape[2] if data.ndim > 2 else 1
+    labels, units = _get_chan_labels({'labels': [_read_channel_labels(path, layout)]})
+
+    previews = []
+    for chan in range(n_chans):
+        plane = data[:, :, chan] if data.ndim > 2 else data
+        png_path = os.path.join(cache_dir, f"{key}_{chan}.png")
+        with open(png_path, 'wb') as f:
+            f.write(_png(_thumbnail(plane, size)))
+        previews.append({
+            'label': labels[chan] if chan < len(labels) else f"Channel {chan}",
+            'unit': units[chan] if chan < len(units) else '',
+            'png': png_path,
+        })
+    with open(index_path, 'w') as f:
+        json.dump(previews, f)
+    _evict(cache_dir, budget)
+    return previews
+
+
+def generate_previews_async(path, size=THUMBNAIL_SIZE):
+    """Generate previews in the preview process pool and return the future."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=PREVIEW_WORKERS)
+    return _executor.submit(generate_previews, path, size)
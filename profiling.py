@@ -0,0 +1,200 @@
+from __future__ import annotations
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from resilience import wait_time
+
+# User IDs allowed to profile sessions; '*' allows everyone
+PROFILING_ADMINS = {user.strip() for user in os.getenv("PROFILING_ADMINS", "").split(',') if user.strip()}
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5")) / 1000
+MAX_STACK_DEPTH = 128
+
+
+def is_admin(user):
+    return '*' in PROFILING_ADMINS or str(user) in PROFILING_ADMINS
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Profiler:
+    """Sampling profiler for the callbacks of one user's sessions.
+
+    While a profiled callback runs, a sampler thread records its thread's stack every
+    ``interval`` seconds as a collapsed stack (``label;file:function;... count``, the
+    input format of flamegraph.pl and speedscope). Each call also records its wall time,
+    the CPU time of its thread and the time spent waiting on DataFed.
+    """
+
+    def __init__(self, user, interval=PROFILE_SAMPLE_INTERVAL):
+        self.user = user
+        self.interval = interval
+        self.started = time.time()
+        self.stats = {}
+        self.stacks = Counter()
+        self._active = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{user}", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def running(self):
+        return not self._stopped.is_set()
+
+    @contextmanager
+    def profile(self, label, code):
+        thread_id = threading.get_ident()
+        with self._lock:
+            outer = self._active.get(thread_id)
+            if outer is None:
+                self._active[thread_id] = (label, code)
+        wall, cpu, wait = time.perf_counter(), time.thread_time(), wait_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            wait = wait_time() - wait
+            with self._lock:
+                if outer is None:
+                    del self._active[thread_id]
+                stats = self.stats.setdefault(label, {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'datafed_wait': 0.0, 'max_wall': 0.0})
+                stats['calls'] += 1
+                stats['wall'] += wall
+                stats['cpu'] += cpu
+                stats['datafed_wait'] += wait
+                stats['max_wall'] = max(stats['max_wall'], wall)
+
+    def _sample(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                active = dict(self._active)
+            if not active:
+                continue
+            frames = sys._current_frames()
+            samples = []
+            for thread_id, (label, code) in active.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(frame.f_code)
+                    if frame.f_code is code:
+                        break  # Panel and Tornado frames above the callback are left out
+                    frame = frame.f_back
+                samples.append(';'.join([label] + [_frame_label(c) for c in reversed(stack)]))
+            with self._lock:
+                self.stacks.update(samples)
+
+    def report(self):
+        """Per-callback timings; ``other`` is wall time neither on CPU nor waiting on DataFed (I/O, locks, GIL)."""
+        with self._lock:
+            stats = {label: dict(values) for label, values in self.stats.items()}
+            samples = sum(self.stacks.values())
+        for values in stats.values():
+            values['other'] = max(0.0, values['wall'] - values['cpu'] - values['datafed_wait'])
+        return {
+            'user': self.user, 'started': self.started, 'running': self.running,
+            'sample_interval': self.interval, 'samples': samples, 'callbacks': stats,
+        }
+
+    def collapsed_stacks(self):
+        with self._lock:
+            return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def summary_markdown(self):
+        report = self.report()
+        lines = [
+            f"**Profiling {report['user']}** ({'running' if report['running'] else 'stopped'}, {report['samples']} samples)",
+            "",
+            "| Callback | Calls | Wall (s) | CPU (s) | DataFed wait (s) | Other (s) | Max (s) |",
+            "|---|---|---|---|---|---|---|",
+        ]
+        for label, s in sorted(report['callbacks'].items(), key=lambda item: -item[1]['wall']):
+            lines.append(
+                f"| {label} | {s['calls']} | {s['wall']:.3f} | {s['cpu']:.3f} | {s['datafed_wait']:.3f} "
+                f"| {s['other']:.3f} | {s['max_wall']:.3f} |"
+            )
+        return "\n".join(lines)
+
+
+profilers = {}
+_targets = []
+_targets_lock = threading.Lock()
+
+
+def profiled(label=None):
+    """Profile the decorated method while its object has a profiler attached.
+
+    When profiling is off the only cost is one attribute lookup per call.
+    """
+    def decorator(fn):
+        name = label or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            profiler = self._profiler
+            if profiler is None:
+                return fn(self, *args, **kwargs)
+            with profiler.profile(name, fn.__code__):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register(obj, owner):
+    """Make ``obj`` profilable for the user of ``owner`` (its ``profile_user``, re-read by :func:`sync`)."""
+    with _targets_lock:
+        _targets.append((weakref.ref(obj), weakref.ref(owner)))
+    sync()
+
+
+def _live_targets():
+    with _targets_lock:
+        _targets[:] = [(obj, owner) for obj, owner in _targets if obj() is not None and owner() is not None]
+        return [(obj(), owner()) for obj, owner in _targets]
+
+
+def sync():
+    """Attach running profilers to the registered objects of their user, and detach the others."""
+    for obj, owner in _live_targets():
+        if obj is None or owner is None:
+            continue
+        profiler = profilers.get(owner.profile_user)
+        obj._profiler = profiler if profiler is not None and profiler.running else None
+
+
+def sessions():
+    """Users with at least one live profilable session."""
+    users = {owner.profile_user for _, owner in _live_targets() if owner is not None}
+    return sorted(str(user) for user in users if user)
+
+
+def start(user):
+    stop(user)
+    profilers[user] = Profiler(user)
+    sync()
+    return profilers[user]
+
+
+def stop(user):
+    profiler = profilers.get(user)
+    if profiler is not None:
+        profiler.stop()
+        sync()
+    return profiler
+
+
+def report_json(user):
+    profiler = profilers.get(user)
+    return json.dumps(profiler.report() if profiler else {}, indent=2)
@@ -0,0 +1,113 @@
+from __future__ import annotations
+import os
+from cache import LRUCache
+from client_pool import map_clients
+
+PROVENANCE_CACHE_TTL = float(os.getenv("PROVENANCE_CACHE_TTL", "300"))
+PROVENANCE_MAX_DEPTH = int(os.getenv("PROVENANCE_MAX_DEPTH", "10"))
+PROVENANCE_MAX_NODES = int(os.getenv("PROVENANCE_MAX_NODES", "5000"))
+
+UPSTREAM = 'upstream'
+DOWNSTREAM = 'downstream'
+BOTH = 'both'
+
+# DataFed's DependencyType and DependencyDir enums
+DEP_TYPES = {0: 'derived from', 1: 'component of', 2: 'new version of'}
+DIR_OUT = 1  # The record depends on the other one
+
+# ``{(user, context): {'id', 'title', 'deps': [(id, type, dir), ...]}}`` per record ID, so
+# a changed record is dropped for every user with one lookup
+node_cache = LRUCache(maxsize=20000, ttl=PROVENANCE_CACHE_TTL)
+
+
+def fetch_node(api, record_id, context=None):
+    """Return the title and dependencies of ``record_id``, from the node cache when possible.
+
+    Only the fields the graph needs are read from the ``dataView`` reply; the metadata is
+    not decoded.
+    """
+    scope = (api.getAuthUser(), context)
+    nodes = node_cache.get(record_id)
+    node = nodes.get(scope) if nodes is not None else None
+    if node is None:
+        record = api.dataView(data_id=record_id, context=context)[0].data[0]
+        node = {
+            'id': record.id,
+            'title': record.title,
+            'deps': [(dep.id, dep.type, dep.dir) for dep in record.deps],
+        }
+        if nodes is None:
+            node_cache.set(record_id, {scope: node})
+        else:
+            # Added in place so the entry keeps its age and the TTL still bounds its oldest node
+            nodes[scope] = node
+    return node
+
+
+def fetch_nodes(api, record_ids, context=None):
+    """Fetch several nodes in order; a record that cannot be read gives a node with an ``error``.
+
+    The calls are spread over the session's client pool (see :func:`client_pool.map_clients`).
+    """
+    def fetch(client, record_id):
+        try:
+            return fetch_node(client, record_id, context)
+        except Exception as e:
+            return {'id': record_id, 'title': '', 'deps': [], 'error': str(e)}
+
+    return map_clients(api, fetch, record_ids)
+
+
+def invalidate_node(record_id):
+    """Drop the cached node of ``record_id`` for every user and context."""
+    node_cache.pop(record_id)
+
+
+def walk(api, root_id, context=None, direction=BOTH, max_depth=PROVENANCE_MAX_DEPTH, max_nodes=PROVENANCE_MAX_NODES):
+    """Traverse the dependency graph of ``root_id`` breadth first, yielding one dict per level.
+
+    Each level is fetched with :func:`fetch_nodes`. Each level has ``nodes`` (with their
+    ``layer``: negative for ancestors, positive for descendants), ``edges`` as
+    ``(source, target, type)`` from a record to the one derived from it, whose ends have all
+    been yielded by then, and ``truncated`` when the depth or node budget cut the graph short.
+    Ancestors are only followed upstream and descendants only downstream.
+    """
+    layers = {root_id: 0}
+    frontier = [root_id]
+    edges = set()
+    pending = []
+    depth = 0
+    while frontier:
+        nodes = fetch_nodes(api, frontier, context)
+        for requested, node in zip(frontier, nodes):
+            if node['id'] != requested:  # An alias was resolved
+                layers[node['id']] = layers.pop(requested)
+        level = {'depth': depth, 'nodes': [], 'edges': pending, 'truncated': False}
+        pending, next_frontier = [], []
+        for node in nodes:
+            layer = layers[node['id']]
+            level['nodes'].append({
+                'id': node['id'], 'title': node['title'], 'layer': layer,
+                'deps': len(node['deps']), 'error': node.get('error'),
+            })
+            for dep_id, dep_type, dep_dir in node['deps']:
+                upstream = dep_dir == DIR_OUT
+                if (layer < 0 and not upstream) or (layer > 0 and upstream):
+                    continue
+                if layer == 0 and direction == (DOWNSTREAM if upstream else UPSTREAM):
+                    continue
+                if dep_id not in layers:
+                    if depth >= max_depth or len(layers) >= max_nodes:
+                        level['truncated'] = True
+                        continue
+                    layers[dep_id] = layer - 1 if upstream else layer + 1
+                    next_frontier.append(dep_id)
+                edge = (dep_id, node['id'], dep_type) if upstream else (node['id'], dep_id, dep_type)
+                if edge not in edges:
+                    edges.add(edge)
+                    pending.append(edge)
+        if not next_frontier:
+            level['edges'] = level['edges'] + pending
+        yield level
+        frontier = next_frontier
+        depth += 1
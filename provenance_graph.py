@@ -0,0 +1,145 @@
+from __future__ import annotations
+import threading
+from collections import Counter
+import param
+import panel as pn
+from panel.viewable import Viewer
+from provenance import BOTH, DOWNSTREAM, UPSTREAM, DEP_TYPES, PROVENANCE_MAX_DEPTH, PROVENANCE_MAX_NODES, walk
+from scheduler import run_on_doc
+
+DEP_COLORS = {0: '#1f77b4', 1: '#2ca02c', 2: '#ff7f0e'}
+
+
+class ProvenanceGraph(Viewer):
+    """Dependency graph of a record, drawn in layers as the traversal reaches them.
+
+    Ancestors are placed left of the record and descendants right of it, one column per
+    level; each level is streamed into the plot as soon as its records have been fetched.
+    """
+
+    context = param.String(default=None, allow_None=True, doc="Context used to resolve record IDs.")
+    record_id = param.String(default="", label="Record ID")
+    direction = param.Selector(default=BOTH, objects=[BOTH, UPSTREAM, DOWNSTREAM], label="Direction")
+    max_depth = param.Integer(default=PROVENANCE_MAX_DEPTH, bounds=(1, 100), label="Max Depth")
+    max_nodes = param.Integer(default=PROVENANCE_MAX_NODES, bounds=(1, 100000), label="Max Records")
+
+    def __init__(self, api, **params):
+        super().__init__(**params)
+        from bokeh.models import ColumnDataSource, HoverTool
+        from bokeh.plotting import figure
+        self._api = api
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._doc = None
+        self._positions = {}
+        self._rows = Counter()
+        self._nodes = ColumnDataSource(data=_empty_nodes())
+        self._edges = ColumnDataSource(data=_empty_edges())
+        plot = figure(
+            height=600, sizing_mode='stretch_width', tools='pan,wheel_zoom,box_zoom,reset,save',
+            x_axis_label='Level (ancestors < 0 < descendants)', toolbar_location='above'
+        )
+        plot.yaxis.visible = False
+        plot.ygrid.visible = False
+        plot.segment('x0', 'y0', 'x1', 'y1', source=self._edges, line_color='color', line_alpha=0.6)
+        nodes = plot.scatter('x', 'y', source=self._nodes, size=10, fill_color='color', line_color='#333333')
+        plot.add_tools(HoverTool(renderers=[nodes], tooltips=[('ID', '@id'), ('Title', '@title'), ('Dependencies', '@deps')]))
+        self._plot = pn.pane.Bokeh(plot, sizing_mode='stretch_width')
+        self._load_button = pn.widgets.Button(name='Show Dependency Graph', button_type='primary')
+        self._load_button.on_click(self.load)
+        self._status = pn.pane.Markdown("", width=600)
+        self._layout = pn.Column(
+            pn.Param(self.param, parameters=['record_id', 'direction', 'max_depth', 'max_nodes'], show_name=False),
+            self._load_button, self._status, self._plot, sizing_mode='stretch_width'
+        )
+
+    def __panel__(self):
+        return self._layout
+
+    def load(self, event=None):
+        """Clear the graph and traverse the dependencies of ``record_id`` in the background."""
+        record_id = self.record_id.strip()
+        if not record_id:
+            self._status.object = "<h3>Warning: Enter a record ID</h3>"
+            return
+        if record_id.isdigit():
+            record_id = f"d/{record_id}"
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self._doc = pn.state.curdoc
+        self._positions.clear()
+        self._rows.clear()
+        self._nodes.data = _empty_nodes()
+        self._edges.data = _empty_edges()
+        self._status.object = f"<h3>Loading dependencies of {record_id}...</h3>"
+        threading.Thread(
+            target=self._walk, args=(generation, record_id, self.context, self.direction, self.max_depth, self.max_nodes),
+            name='provenance-walk', daemon=True
+        ).start()
+
+    def _current(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def _walk(self, generation, record_id, context, direction, max_depth, max_nodes):
+        count, truncated = 0, False
+        try:
+            for level in walk(self._api, record_id, context, direction, max_depth, max_nodes):
+                if not self._current(generation):
+                    return
+                count += len(level['nodes'])
+                truncated = truncated or level['truncated']
+                self._schedule(lambda level=level: self._add_level(generation, level))
+        except Exception as e:
+            message = f"<h3>Error: Failed to load dependencies: {e}</h3>"
+        else:
+            message = f"<h3>{count} record(s) in the dependency graph of {record_id}</h3>"
+            if truncated:
+                message += f"<h3>Warning: Stopped at {max_depth} levels or {max_nodes} records</h3>"
+        if self._current(generation):
+            self._schedule(lambda: setattr(self._status, 'object', message))
+
+    def _schedule(self, callback):
+        run_on_doc(self._doc, callback)
+
+    def _add_level(self, generation, level):
+        if not self._current(generation):
+            return
+        nodes = _empty_nodes()
+        for node in level['nodes']:
+            x, y = self._position(node['id'], node['layer'])
+            nodes['x'].append(x)
+            nodes['y'].append(y)
+            nodes['id'].append(node['id'])
+            nodes['title'].append(node['error'] or node['title'])
+            nodes['deps'].append(node['deps'])
+            nodes['color'].append('#d62728' if node['error'] else '#ffdd57' if node['layer'] == 0 else '#9ecae1')
+        edges = _empty_edges()
+        for source, target, dep_type in level['edges']:
+            (x0, y0), (x1, y1) = self._positions[source], self._positions[target]
+            edges['x0'].append(x0)
+            edges['y0'].append(y0)
+            edges['x1'].append(x1)
+            edges['y1'].append(y1)
+            edges['type'].append(DEP_TYPES.get(dep_type, str(dep_type)))
+            edges['color'].append(DEP_COLORS.get(dep_type, '#999999'))
+        if nodes['id']:
+            self._nodes.stream(nodes)
+        if edges['x0']:
+            self._edges.stream(edges)
+
+    def _position(self, record_id, layer):
+        """Next free row of the record's level, counting down from the top."""
+        if record_id not in self._positions:
+            self._positions[record_id] = (layer, -self._rows[layer])
+            self._rows[layer] += 1
+        return self._positions[record_id]
+
+
+def _empty_nodes():
+    return {'x': [], 'y': [], 'id': [], 'title': [], 'deps': [], 'color': []}
+
+
+def _empty_edges():
+    return {'x0': [], 'y0': [], 'x1': [], 'y1': [], 'type': [], 'color': []}
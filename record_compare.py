@@ -0,0 +1,112 @@
+from __future__ import annotations
+import json
+import os
+from cache import LRUCache
+from client_pool import map_clients
+
+RECORD_CACHE_TTL = float(os.getenv("RECORD_CACHE_TTL", "300"))
+
+# Decoded ``dataView`` replies as ``{(user, context): reply}`` per record ID, so a user only
+# gets records fetched with their own permissions and a changed record is dropped at once
+record_cache = LRUCache(maxsize=512, ttl=RECORD_CACHE_TTL)
+
+_MISSING = object()
+
+
+def decode_record(reply):
+    """Return a ``dataView`` reply as a dict with each record's metadata parsed from JSON."""
+    from google.protobuf.json_format import MessageToJson
+    decoded = json.loads(MessageToJson(reply))
+    for record in decoded.get('data', []):
+        if 'metadata' in record:
+            try:
+                record['metadata'] = json.loads(record['metadata'])
+            except json.JSONDecodeError:
+                pass
+    return decoded
+
+
+def view_record(api, record_id, context):
+    """Return the decoded ``dataView`` reply of ``record_id``, always from DataFed."""
+    return decode_record(api.dataView(data_id=record_id, context=context)[0])
+
+
+def fetch_record(api, record_id, context):
+    """Return the decoded ``dataView`` reply of ``record_id``, from the record cache when possible.
+
+    The returned dict is shared with the cache and must not be modified in place.
+    """
+    scope = (api.getAuthUser(), context)
+    replies = record_cache.get(record_id)
+    decoded = replies.get(scope) if replies is not None else None
+    if decoded is None:
+        decoded = view_record(api, record_id, context)
+        if replies is None:
+            record_cache.set(record_id, {scope: decoded})
+        else:
+            # Added in place so the entry keeps its age and the TTL still bounds its oldest reply
+            replies[scope] = decoded
+    return decoded
+
+
+def fetch_records(api, record_ids, context):
+    """Return the decoded records of ``record_ids`` in order.
+
+    Records missing from the record cache are fetched in parallel over the session's
+    client pool (see :func:`client_pool.map_clients`).
+    """
+    return map_clients(api, lambda client, record_id: fetch_record(client, record_id, context)['data'][0], record_ids)
+
+
+def invalidate_record(record_id):
+    """Drop ``record_id`` from the record cache, for every user and context."""
+    record_cache.pop(record_id)
+
+
+def flatten_metadata(metadata, prefix=''):
+    """Yield ``(dotted key, value)`` for the leaves of nested metadata; lists are leaves."""
+    if not isinstance(metadata, dict):
+        yield prefix or '(metadata)', metadata
+        return
+    for key, value in metadata.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict) and value:
+            yield from flatten_metadata(value, path)
+        else:
+            yield path, value
+
+
+def compare_metadata(records, labels=None):
+    """Return a table of the metadata keys whose values differ between ``records``.
+
+    Nested keys are flattened to dotted paths and aligned in one pass into a column per
+    record; lists are compared as a whole. Keys missing from a record count as differing
+    and are shown empty.
+    """
+    labels = labels or [record.get('id', str(i)) for i, record in enumerate(records)]
+    count = len(records)
+    columns = {}
+    for index, record in enumerate(records):
+        if record.get('metadata') is None:
+            continue
+        for key, value in flatten_metadata(record['metadata']):
+            values = columns.get(key)
+            if values is None:
+                values = columns[key] = [_MISSING] * count
+            values[index] = value
+
+    rows = []
+    for key, values in columns.items():
+        first = values[0]
+        if any(value is _MISSING or value != first for value in values):
+            rows.append([key] + [_display(value) for value in values])
+    import pandas as pd
+    return pd.DataFrame(rows, columns=['key'] + list(labels))
+
+
+def _display(value):
+    if value is _MISSING:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
@@ -0,0 +1,227 @@
+from __future__ import annotations
+import os
+import random
+import threading
+import time
+import weakref
+
+CALL_TIMEOUT = float(os.getenv("DATAFED_CALL_TIMEOUT", "30"))
+RETRY_ATTEMPTS = int(os.getenv("DATAFED_RETRY_ATTEMPTS", "3"))
+BACKOFF_BASE = float(os.getenv("DATAFED_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("DATAFED_BACKOFF_MAX", "8"))
+BREAKER_THRESHOLD = int(os.getenv("DATAFED_BREAKER_THRESHOLD", "5"))
+BREAKER_RESET = float(os.getenv("DATAFED_BREAKER_RESET", "30"))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# API methods that are safe to repeat after a transient failure
+IDEMPOTENT_METHODS = {
+    'dataView', 'collectionView', 'collectionItemsList', 'collectionGetParents', 'projectList',
+    'projectView', 'queryDirect', 'queryList', 'queryExec', 'schemaView', 'repoList', 'setContext',
+}
+# API methods that never talk to the server
+LOCAL_METHODS = {'getAuthUser', 'getContext', 'timestampToStr', 'strToTimestamp'}
+# API methods that do not send a request but reset the client's socket
+SOCKET_METHODS = {'logout'}
+
+_local = threading.local()
+_client_locks = weakref.WeakKeyDictionary()
+_client_locks_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling DataFed while the circuit breaker is open."""
+
+
+class CallTimeoutError(TimeoutError):
+    """Raised when a DataFed call does not answer within its timeout."""
+
+
+def is_transient(error):
+    return isinstance(error, (TimeoutError, ConnectionError, OSError)) or 'timeout' in str(error).lower()
+
+
+class CircuitBreaker:
+    """Process-wide breaker that stops calls to DataFed after repeated transient failures.
+
+    After ``threshold`` consecutive failures the breaker opens and calls fail fast. Once
+    ``reset_timeout`` seconds have passed a single probe call is let through (half-open);
+    its outcome closes the breaker again or re-opens it.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self.counters = {'calls': 0, 'failures': 0, 'retries': 0, 'timeouts': 0, 'rejected': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def before_call(self):
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN or (state == HALF_OPEN and self._probing):
+                self.counters['rejected'] += 1
+                retry_in = max(0, self.reset_timeout - (time.monotonic() - self._opened_at))
+                raise CircuitOpenError(f"DataFed is unavailable, retrying in {retry_in:.0f} s")
+            if state == HALF_OPEN:
+                self._probing = True
+            self.counters['calls'] += 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self, timeout=False):
+        with self._lock:
+            self.counters['failures'] += 1
+            if timeout:
+                self.counters['timeouts'] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.threshold:
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def record_retry(self):
+        with self._lock:
+            self.counters['retries'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, state=self._current_state(), consecutive_failures=self._failures)
+
+
+breaker = CircuitBreaker()
+
+
+def wait_time():
+    """Total seconds the current thread has spent waiting on DataFed calls, backoff included."""
+    return getattr(_local, 'wait', 0.0)
+
+
+def client_lock(client):
+    """Lock held while a call is in flight on ``client``.
+
+    A DataFed ``API`` sends every request over one ZeroMQ socket and matches the reply by
+    a counter that is not thread safe, so a client must carry one request at a time.
+    """
+    with _client_locks_lock:
+        lock = _client_locks.get(client)
+        if lock is None:
+            lock = _client_locks[client] = threading.RLock()
+        return lock
+
+
+def _is_timeout(error):
+    # MessageLib raises a bare Exception("Timeout!!!...") when no reply arrives in time
+    return isinstance(error, TimeoutError) or str(error).startswith('Timeout')
+
+
+def _reset(client):
+    """Reconnect the client's socket so a late reply to an abandoned request cannot be taken for the next one."""
+    mapi = getattr(client, '_mapi', None)
+    if mapi is None:
+        return
+    try:
+        mapi._conn.reset()
+        while mapi._conn.recv(0)[0] is not None:
+            pass
+    except Exception:
+        pass
+
+
+def call(fn, *args, idempotent=False, timeout=CALL_TIMEOUT, retries=RETRY_ATTEMPTS, client=None, **kwargs):
+    """Call ``fn`` on the calling thread through the circuit breaker.
+
+    With ``client`` (the ``API`` that ``fn`` belongs to) the call holds the client's lock,
+    ``timeout`` is applied to the client's socket and the connection is reset after a
+    timeout. Idempotent calls are retried on transient failures with jittered exponential
+    backoff. Errors reported by the server itself are raised unchanged and do not count
+    against the breaker.
+    """
+    started = time.perf_counter()
+    try:
+        return _call(fn, args, kwargs, idempotent, timeout, retries, client)
+    finally:
+        _local.wait = wait_time() + time.perf_counter() - started
+
+
+def _call(fn, args, kwargs, idempotent, timeout, retries, client):
+    attempts = retries if idempotent else 1
+    for attempt in range(attempts):
+        breaker.before_call()
+        try:
+            if client is None:
+                result = fn(*args, **kwargs)
+            else:
+                with client_lock(client):
+                    mapi = getattr(client, '_mapi', None)
+                    if mapi is not None:
+                        mapi.setDefaultTimeout(int(timeout * 1000))
+                    try:
+                        result = fn(*args, **kwargs)
+                    except Exception as e:
+                        if _is_timeout(e) or 'Mismatched reply' in str(e):
+                            _reset(client)
+                        raise
+        except Exception as e:
+            error = CallTimeoutError(f"DataFed did not answer within {timeout:.0f} s") if _is_timeout(e) else e
+        else:
+            breaker.record_success()
+            return result
+        if not is_transient(error):
+            breaker.record_success()
+            raise error
+        breaker.record_failure(timeout=isinstance(error, CallTimeoutError))
+        if attempt == attempts - 1:
+            raise error
+        breaker.record_retry()
+        time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+
+class ResilientAPI:
+    """Wraps a DataFed ``API`` so every server call goes through :func:`call`.
+
+    Calls from several threads are safe; they take turns on the client's socket.
+    """
+
+    def __init__(self, api):
+        self._api = api
+
+    @property
+    def raw(self):
+        return self._api
+
+    def __getattr__(self, name):
+        attr = getattr(self._api, name)
+        if name in LOCAL_METHODS or name.startswith('_') or not callable(attr):
+            return attr
+        if name in SOCKET_METHODS:
+            def locked(*args, **kwargs):
+                with client_lock(self._api):
+                    return attr(*args, **kwargs)
+            return locked
+
+        def wrapped(*args, **kwargs):
+            return call(attr, *args, idempotent=name in IDEMPOTENT_METHODS, client=self._api, **kwargs)
+
+        wrapped.__name__ = name
+        return wrapped
@@ -0,0 +1,83 @@
+from __future__ import annotations
+import threading
+from functools import partial
+
+
+def run_on_doc(doc, callback):
+    """Run ``callback`` on ``doc``'s event loop, or right away outside a server session.
+
+    Bokeh models, and so Panel widgets, must not be changed from other threads.
+    """
+    if doc is not None and doc.session_context is not None:
+        doc.add_next_tick_callback(callback)
+    else:
+        callback()
+
+
+def session_callback(callback):
+    """Wrap ``callback`` so that, called from any thread, it runs in the current session."""
+    import panel as pn
+    doc = pn.state.curdoc
+    return lambda *args, **kwargs: run_on_doc(doc, partial(callback, *args, **kwargs))
+
+
+class UpdateScheduler:
+    """Debounce and coalesce background fetches triggered by parameter changes.
+
+    Each fetch is scheduled under a key. Scheduling a key again within ``delay`` seconds
+    replaces the pending fetch, and results of a fetch that was superseded while it was
+    in flight are dropped, so only the latest selection is applied. Fetches run on a timer
+    thread; ``apply`` and ``on_error`` run in the session that scheduled them.
+    """
+
+    def __init__(self, delay=0.25):
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._timers = {}
+        self._generations = {}
+
+    def schedule(self, key, fetch, apply, on_error=None):
+        import panel as pn
+        doc = pn.state.curdoc
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            pending = self._timers.pop(key, None)
+            if pending is not None:
+                pending.cancel()
+            timer = threading.Timer(self.delay, self._run, args=(doc, key, generation, fetch, apply, on_error))
+            timer.daemon = True
+            self._timers[key] = timer
+        timer.start()
+
+    def cancel(self, key):
+        """Drop the pending fetch for ``key`` and discard any in-flight result."""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            pending = self._timers.pop(key, None)
+        if pending is not None:
+            pending.cancel()
+
+    def is_current(self, key, generation):
+        with self._lock:
+            return self._generations.get(key) == generation
+
+    def _run(self, doc, key, generation, fetch, apply, on_error):
+        with self._lock:
+            if self._generations.get(key) != generation:
+                return
+            self._timers.pop(key, None)
+        try:
+            result = fetch()
+        except Exception as e:
+            if on_error is not None:
+                self._deliver(doc, key, generation, on_error, e)
+            return
+        self._deliver(doc, key, generation, apply, result)
+
+    def _deliver(self, doc, key, generation, callback, value):
+        def deliver():
+            # Checked again on the session's thread, where a newer schedule may have landed meanwhile
+            if self.is_current(key, generation):
+                callback(value)
+        run_on_doc(doc, deliver)
@@ -0,0 +1,41 @@
+from __future__ import annotations
+import json
+import os
+from cache import LRUCache
+
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", "600"))
+
+# Compiled validators keyed by the schema ID as referenced; entries expire so that a
+# reference without a version picks up newly published versions
+validator_cache = LRUCache(maxsize=256, ttl=SCHEMA_CACHE_TTL)
+
+
+def fetch_schema(api, schema_id):
+    """Return ``(version, definition)`` of a DataFed metadata schema."""
+    reply = api.schemaView(schema_id, resolve=True)
+    schema = reply[0].schema[0]
+    return schema.ver, json.loads(getattr(schema, 'def'))
+
+
+def get_validator(api, schema_id):
+    """Return a compiled validator for ``schema_id``, fetching the schema only once."""
+    validator = validator_cache.get(schema_id)
+    if validator is None:
+        import jsonschema
+        version, definition = fetch_schema(api, schema_id)
+        cls = jsonschema.validators.validator_for(definition)
+        cls.check_schema(definition)
+        validator = cls(definition)
+        validator_cache.set(schema_id, validator)
+        if ':' not in schema_id:
+            validator_cache.set(f"{schema_id}:{version}", validator)
+    return validator
+
+
+def validate_metadata(api, schema_id, metadata):
+    """Return a list of ``"path: message"`` errors; empty when valid or without a schema."""
+    if not schema_id:
+        return []
+    validator = get_validator(api, schema_id)
+    errors = sorted(validator.iter_errors(metadata), key=lambda error: list(error.absolute_path))
+    return [f"{'/'.join(str(p) for p in error.absolute_path) or '(root)'}: {error.message}" for error in errors]
@@ -0,0 +1,84 @@
+from __future__ import annotations
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(os.path.expanduser("~"), ".datafed_panel", "sessions.db"))
+
+
+def listing_stamp(listing):
+    """Version stamp of a listing snapshot; changes whenever its content changes."""
+    return hashlib.sha1(json.dumps(listing, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class SessionStore:
+    """Per-user UI state and listing snapshots kept in a local SQLite file.
+
+    A state is a JSON object holding the last selections (``context``, ``collection``,
+    ``record``, ``directory``) and ``listings``: snapshots of the contexts, collections
+    and records lists, each stored as ``{'stamp', 'saved', 'data'}``.
+    """
+
+    def __init__(self, path=SESSION_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS sessions (user TEXT PRIMARY KEY, state TEXT NOT NULL, updated REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and is closed when the block ends."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def load(self, user):
+        with self._connect() as conn:
+            row = conn.execute("SELECT state FROM sessions WHERE user=?", (user,)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def update(self, user, **selections):
+        """Merge ``selections`` into the stored state of ``user``."""
+        with self._lock:
+            state = self.load(user)
+            state.update(selections)
+            self._save(user, state)
+
+    def save_listing(self, user, name, data):
+        """Store a listing snapshot and return its version stamp."""
+        stamp = listing_stamp(data)
+        with self._lock:
+            state = self.load(user)
+            state.setdefault('listings', {})[name] = {'stamp': stamp, 'saved': time.time(), 'data': data}
+            self._save(user, state)
+        return stamp
+
+    def listing(self, state, name):
+        return state.get('listings', {}).get(name)
+
+    def _save(self, user, state):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (user, state, updated) VALUES (?, ?, ?)",
+                (user, json.dumps(state), time.time())
+            )
+
+
+_session_store = None
+
+
+def get_session_store():
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore()
+    return _session_store
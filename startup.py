@@ -0,0 +1,19 @@
+"""Process start-up shared by the Panel app, the ``--setup`` preload script and the CLI."""
+import threading
+from dotenv import load_dotenv
+
+_configured = False
+_lock = threading.Lock()
+
+
+def configure():
+    """Load ``.env`` once per process.
+
+    Modules read their settings from the environment when imported, so this must run
+    before the application modules are imported.
+    """
+    global _configured
+    with _lock:
+        if not _configured:
+            load_dotenv()
+            _configured = True
@@ -1,9 +1,97 @@
-from igor import binarywave as bw
 import json
-import numpy as np
+import re
+from metadata_encoding import decode_bytes, encode_metadata
 
 
-def _read_parms(ibw_wave, codec='utf-8'):
+_NUMBER = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+_INTEGER = re.compile(r'[+-]?\d+')
+
+
+class NoteSchema:
+    """Typed description of an instrument's wave note.
+
+    ``version`` is a regex matched against the note's ``Version`` value to pick the
+    schema, and ``types`` forces keys to ``str``, ``int``, ``float`` or ``bool`` regardless
+    of what their values look like (e.g. zero padded suffixes stay strings).
+    """
+
+    def __init__(self, name, version=None, types=None):
+        self.name = name
+        self.version = re.compile(version) if version else None
+        self.types = types or {}
+
+    def matches(self, raw):
+        if self.version is None:
+            return True
+        return bool(self.version.match(raw.get('Version', '')))
+
+    def coerce(self, key, raw_value):
+        kind = self.types[key]
+        if kind is bool:
+            return raw_value.strip().lower() in ('1', 'true', 'yes', 'on')
+        if kind is str:
+            return raw_value
+        try:
+            return kind(float(raw_value)) if kind is int else kind(raw_value)
+        except ValueError:
+            return raw_value
+
+
+_ASYLUM_TYPES = {
+    'Version': str, 'Date': str, 'Time': str, 'BaseName': str, 'BaseSuffix': str,
+    'ImageNote': str, 'UserName': str, 'FileName': str, 'MicroscopeModel': str,
+    'ImagingMode': str, 'ScanPoints': int, 'ScanLines': int, 'PointsLines': int,
+}
+
+# Checked in order; the last entry accepts any note
+NOTE_SCHEMAS = [
+    NoteSchema('asylum_ar16', version=r'16\.', types=dict(_ASYLUM_TYPES, ARVersion=str)),
+    NoteSchema('asylum_ar', version=r'1[0-5]\.', types=_ASYLUM_TYPES),
+    NoteSchema('generic'),
+]
+
+
+def parse_note(note, schema=None):
+    """Parse a ``\\r`` separated Igor wave note into a typed dict.
+
+    Each line is split on its first colon only, so values such as times keep their
+    colons. Numeric values are recognised with a compiled regex: integers are converted
+    exactly, whatever their size, and the other numbers together in a single NumPy call,
+    with integral ones such as ``2.0`` becoming ints. Dots in keys become underscores;
+    values are left untouched.
+    """
+    keys = []
+    values = []
+    for line in note.split('\r'):
+        key, sep, value = line.partition(':')
+        key = key.strip()
+        if sep and key:
+            keys.append(key.replace('.', '_'))
+            values.append(value.strip())
+    raw = dict(zip(keys, values))
+    if schema is None:
+        schema = next(s for s in NOTE_SCHEMAS if s.matches(raw))
+
+    is_number, is_integer = _NUMBER.fullmatch, _INTEGER.fullmatch
+    decimal = []
+    for i, value in enumerate(values):
+        if is_integer(value):
+            values[i] = int(value)
+        elif is_number(value):
+            decimal.append(i)
+    if decimal:
+        import numpy as np
+        numbers = np.array([values[i] for i in decimal], dtype=float)
+        integral = (np.isfinite(numbers) & (numbers == np.trunc(numbers))).tolist()
+        for i, number, is_int in zip(decimal, numbers.tolist(), integral):
+            values[i] = int(number) if is_int else number
+    parsed = dict(zip(keys, values))
+    for key in schema.types.keys() & raw.keys():
+        parsed[key] = schema.coerce(key, raw[key])
+    return parsed
+
+
+def _read_parms(ibw_wave, codec='utf-8', schema=None):
         
         parm_string = ibw_wave.get('note')
         if type(parm_string) == bytes:
@@ -11,24 +99,7 @@ def _read_parms(ibw_wave, codec='utf-8'):
                 parm_string = parm_string.decode(codec)
             except:
                 parm_string = parm_string.decode('ISO-8859-1')  # for older AR software
-        parm_string = parm_string.rstrip('\r')
-        parm_string = parm_string.replace(".","_")
-        parm_list = parm_string.split('\r')
-        parm_dict = dict()
-        for pair_string in parm_list:
-            temp = pair_string.split(':')
-            if len(temp) == 2:
-                temp = [item.strip() for item in temp]
-                try:
-                    num = float(temp[1])
-                    parm_dict[temp[0]] = num
-                    try:
-                        if num == int(num):
-                            parm_dict[temp[0]] = int(num)
-                    except OverflowError:
-                        pass
-                except ValueError:
-                    parm_dict[temp[0]] = temp[1]
+        parm_dict = parse_note(parm_string.rstrip('\r'), schema)
 
         # Grab the creation and modification times:
         other_parms = ibw_wave.get('wave_header')
@@ -82,6 +153,7 @@ def _read_data(self):
 
 class MyEncoder(json.JSONEncoder):
     def default(self, obj):
+        import numpy as np
         if isinstance(obj, np.integer):
             return int(obj)
         elif isinstance(obj, np.floating):
@@ -89,13 +161,13 @@ class MyEncoder(json.JSONEncoder):
         elif isinstance(obj, np.ndarray):
             return obj.tolist()
         elif isinstance(obj, bytes):
-            return str(obj)
+            return decode_bytes(obj)
         else:
             return super(MyEncoder, self).default(obj)
         
         
 def get_metadata(file_name):
-        
+        from igor2 import binarywave as bw
         ibw_obj = bw.load(file_name)
         parm_encoding='utf-8'
 
@@ -107,7 +179,7 @@ def get_metadata(file_name):
         # images = ibw_wave.get('wData')
 
         #JSON serialize metadata
-        metadata = json.dumps(parm_dict, cls=MyEncoder)
+        metadata = encode_metadata(parm_dict)
         metadata = json.loads(metadata)
         #metadata.update({"File_path" : file_path})
 